@@ -1,15 +1,44 @@
-from .log import Log
-from .plot import plot_logs, plot_logs_grid, plot_histogram, numeric_histogram
-from .config import Config
-from .scheduler import DynamicScheduler, LinearSchedule
-
-__all__ = (
-    Log,
-    plot_logs,
-    plot_logs_grid,
-    plot_histogram,
-    numeric_histogram,
-    DynamicScheduler,
-    LinearSchedule,
-    Config,
-)
+import importlib
+
+'''
+The submodules of this package are imported lazily (PEP 562), so that
+"import conspiracy" is cheap, and a worker process that only uses Log or
+Config never imports the plotting code or its dependencies.
+'''
+
+lazy_attributes = {
+    'Log' : 'log',
+    'FastLog' : 'log',
+    'MipmapLog' : 'log',
+    'MemmapLog' : 'log',
+    'LockedLog' : 'log',
+    'SharedLog' : 'log',
+    'HistogramLog' : 'log',
+    'LogBook' : 'logbook',
+    'plot_logs' : 'plot',
+    'plot_logs_grid' : 'plot',
+    'plot_histogram' : 'plot',
+    'numeric_histogram' : 'plot',
+    'plot_histogram_log' : 'plot',
+    'RenderCache' : 'plot',
+    'Dashboard' : 'dashboard',
+    'aggregate_logs' : 'aggregate',
+    'DynamicScheduler' : 'scheduler',
+    'LinearSchedule' : 'scheduler',
+    'Config' : 'config',
+}
+
+__all__ = tuple(lazy_attributes)
+
+def __getattr__(name):
+    if name in lazy_attributes:
+        module = importlib.import_module(
+            '.' + lazy_attributes[name], __name__)
+        value = getattr(module, name)
+        globals()[name] = value
+        return value
+    raise AttributeError(
+        'module %r has no attribute %r'%(__name__, name))
+
+def __dir__():
+    return sorted(set(globals()) | set(lazy_attributes))
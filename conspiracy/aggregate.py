@@ -0,0 +1,172 @@
+import re
+
+import numpy
+
+from conspiracy.plot import envelope_poly_line
+
+'''
+Aggregates logs of the same metric from many runs (seeds, workers, ...) into
+a single curve with a band around it.  Every log may have compressed a
+different amount, so they are first resampled onto a common grid of x
+coordinates, then the center and band are computed across all runs at once.
+'''
+
+def resample_logs(
+    logs,
+    x_coord='step',
+    x_range=(0.,1.),
+    points=None,
+    extent='union',
+):
+    '''
+    linearly interpolates a list of logs onto one evenly spaced grid
+    
+    x_coord : 'step', 'time' or 'relative_time' (each log relative to its own
+              start, which lines up runs that started at different times)
+    x_range : the fraction of the grid to return
+    points  : the number of grid points, by default the number of rows in the
+              longest log
+    extent  : 'union' for a grid covering every log, where each log is nan
+              outside of its own range, or 'overlap' for a grid covering only
+              the range that all of the logs have reached
+    
+    returns the grid x coordinates and an array of y coordinates with one row
+    per log
+    '''
+    poly_lines = [log.to_poly_line(x_coord) for log in logs]
+    poly_lines = [poly_line for poly_line in poly_lines if len(poly_line)]
+    if not poly_lines:
+        return numpy.zeros(0), numpy.zeros((0, 0))
+    
+    starts = [poly_line[0,0] for poly_line in poly_lines]
+    ends = [poly_line[-1,0] for poly_line in poly_lines]
+    if extent == 'union':
+        x_min, x_max = min(starts), max(ends)
+    elif extent == 'overlap':
+        x_min, x_max = max(starts), min(ends)
+        if x_max < x_min:
+            return numpy.zeros(0), numpy.zeros((len(poly_lines), 0))
+    else:
+        raise ValueError('"extent" must be "union" or "overlap"')
+    
+    if points is None:
+        points = max(len(poly_line) for poly_line in poly_lines)
+    span = x_max - x_min
+    x = numpy.linspace(
+        x_min + span * x_range[0], x_min + span * x_range[1], points)
+    
+    y = numpy.empty((len(poly_lines), points))
+    for i, poly_line in enumerate(poly_lines):
+        y[i] = numpy.interp(
+            x,
+            poly_line[:,0],
+            poly_line[:,1],
+            left=numpy.nan,
+            right=numpy.nan,
+        )
+    
+    return x, y
+
+def sorted_percentile(y, counts, q):
+    '''
+    computes the q percentile of each column of y, which is sorted along the
+    first axis and has counts valid entries in each column, interpolating
+    linearly like numpy.percentile
+    '''
+    rank = (counts - 1) * q / 100.
+    low = numpy.floor(rank).astype(int)
+    high = numpy.minimum(low + 1, counts - 1)
+    columns = numpy.arange(y.shape[1])
+    fraction = rank - low
+    return y[low, columns] * (1. - fraction) + y[high, columns] * fraction
+
+def aggregate_logs(
+    logs,
+    x_coord='step',
+    x_range=(0.,1.),
+    center='mean',
+    band=(25., 75.),
+    points=None,
+    extent='union',
+):
+    '''
+    combines a list of logs into a single poly_line with a center line and a
+    band around it (see plot.envelope_poly_line) that can be passed to
+    plot_poly_lines
+    
+    center : 'mean' or 'median' of the runs at each grid point
+    band   : the (lower, upper) percentiles of the runs at each grid point,
+             or 'std' for the mean +/- one standard deviation
+    
+    see resample_logs for the remaining arguments
+    '''
+    x, y = resample_logs(
+        logs, x_coord=x_coord, x_range=x_range, points=points, extent=extent)
+    
+    if not y.size:
+        return envelope_poly_line(x, x, x, x)
+    
+    # nan (a run that has not reached a grid point) sorts to the end, so
+    # sorting once gives every percentile, and the mean and std only need
+    # the sums over the valid rows
+    y = numpy.sort(y, axis=0)
+    counts = (~numpy.isnan(y)).sum(axis=0)
+    present = counts > 0
+    x, y, counts = x[present], y[:,present], counts[present]
+    valid = numpy.nan_to_num(y)
+    mean = valid.sum(axis=0) / counts
+    
+    if center == 'median':
+        middle = sorted_percentile(y, counts, 50.)
+    else:
+        middle = mean
+    if band == 'std':
+        deviation = numpy.where(numpy.isnan(y), 0., valid - mean)
+        std = numpy.sqrt((deviation**2).sum(axis=0) / counts)
+        lower, upper = mean - std, mean + std
+    else:
+        lower = sorted_percentile(y, counts, band[0])
+        upper = sorted_percentile(y, counts, band[1])
+    
+    return envelope_poly_line(x, middle, lower, upper)
+
+def group_name(path, pattern):
+    '''
+    returns the name of the group that path belongs to.  If the pattern has
+    groups, the name is made of the text they captured, otherwise it is the
+    path with the text matching the pattern replaced by "*", so that the
+    pattern should match the part of the path that differs between runs
+    (for example "seed_[0-9]+")
+    '''
+    if pattern.groups:
+        match = pattern.search(path)
+        if match is None:
+            return path
+        return '/'.join(group or '' for group in match.groups())
+    
+    return pattern.sub('*', path)
+
+def group_logs(logs, pattern):
+    '''
+    splits a dictionary of {path:log} pairs into {group_name:{path:log}}
+    
+    pattern : a regular expression (or string) passed to group_name
+    '''
+    if isinstance(pattern, str):
+        pattern = re.compile(pattern)
+    groups = {}
+    for path, log in logs.items():
+        groups.setdefault(group_name(path, pattern), {})[path] = log
+    return groups
+
+def aggregate_log_groups(logs, pattern, **kwargs):
+    '''
+    groups a dictionary of {path:log} pairs with group_logs and aggregates
+    each group with aggregate_logs
+    
+    returns a dictionary of {group_name:poly_line} pairs
+    '''
+    return {
+        name : aggregate_logs(list(group.values()), **kwargs)
+        for name, group in group_logs(logs, pattern).items()
+    }
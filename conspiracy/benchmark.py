@@ -0,0 +1,309 @@
+import sys
+import time
+import json
+import pickle
+import threading
+import subprocess
+import multiprocessing
+
+import numpy
+
+from conspiracy.log import (
+    Log, FastLog, LockedLog, SharedLog, HistogramLog)
+from conspiracy.plot import plot_logs, plot_poly_lines, RenderCache
+from conspiracy.aggregate import aggregate_logs
+
+'''
+Small benchmarks for the hot paths of this library.  Run them with:
+python -m conspiracy.benchmark
+'''
+
+def benchmark_compression_latency(
+    capacity=2048,
+    steps=2**20,
+    max_spike_ratio=16.,
+):
+    '''
+    measures the per-call latency of Log.log, separating the calls that
+    trigger a compression from the rest
+    
+    The row pairs are averaged while the log fills up, so a compressing call
+    only pays for copying them back.  That copy still costs more than a
+    regular call, so this checks that the median compressing call stays
+    within max_spike_ratio times the median regular call.
+    '''
+    log = Log(capacity=capacity)
+    data = log.data
+    latencies = numpy.zeros(steps)
+    compressed = numpy.zeros(steps, dtype=bool)
+    for i in range(steps):
+        compression = log.compression
+        t0 = time.perf_counter()
+        log.log(i)
+        latencies[i] = time.perf_counter() - t0
+        compressed[i] = log.compression != compression
+    
+    assert log.data is data, 'the data buffer was reallocated'
+    
+    latencies *= 1e6
+    normal = latencies[~compressed]
+    spikes = latencies[compressed]
+    ratio = numpy.median(spikes) / numpy.median(normal)
+    print('Log.log latency (capacity=%i, %i calls)'%(capacity, steps))
+    print('  regular calls      median %.02fus  p99 %.02fus  max %.02fus'%(
+        numpy.median(normal), numpy.percentile(normal, 99), numpy.max(normal)))
+    print('  compressing calls  median %.02fus  max %.02fus  (%i events)'%(
+        numpy.median(spikes), numpy.max(spikes), spikes.shape[0]))
+    print('  spike ratio        %.01fx'%ratio)
+    assert ratio <= max_spike_ratio, (
+        'compressing calls are %.01fx slower than regular calls'%ratio)
+
+def benchmark_state_formats(capacity=2048, num_logs=100, repeats=5):
+    '''
+    compares the size and round-trip speed of the list-based and binary
+    Log states for a checkpoint containing num_logs logs
+    '''
+    logs = [
+        Log.from_array(numpy.random.rand(capacity*4), capacity=capacity)
+        for _ in range(num_logs)
+    ]
+    
+    def time_it(fn):
+        t0 = time.perf_counter()
+        for _ in range(repeats):
+            result = fn()
+        return (time.perf_counter() - t0) / repeats * 1000, result
+    
+    print('Checkpoint of %i logs (capacity=%i)'%(num_logs, capacity))
+    for name, binary, dumps, loads in (
+        ('list/json', False, json.dumps, json.loads),
+        ('list/pickle', False, pickle.dumps, pickle.loads),
+        ('binary/pickle', True, pickle.dumps, pickle.loads),
+    ):
+        save_ms, checkpoint = time_it(
+            lambda: dumps([log.get_state(binary=binary) for log in logs]))
+        load_ms, _ = time_it(
+            lambda: [Log(state=state) for state in loads(checkpoint)])
+        print('  %-14s size %9.01fKB  save %8.02fms  load %8.02fms'%(
+            name, len(checkpoint)/1024, save_ms, load_ms))
+
+def benchmark_fast_log(steps=2**20, capacity=2048):
+    '''
+    compares the per-call cost of Log.log and FastLog.log for each
+    timestamp policy
+    '''
+    values = numpy.random.rand(steps).tolist()
+    print('Per-call cost of log (%i calls, capacity=%i)'%(steps, capacity))
+    for name, log in (
+        ('Log', Log(capacity=capacity)),
+        ('FastLog(timestamps="value")', FastLog(capacity=capacity)),
+        ('FastLog(timestamps="row")', FastLog(
+            capacity=capacity, timestamps='row')),
+        ('FastLog(timestamps=None)', FastLog(
+            capacity=capacity, timestamps=None)),
+    ):
+        t0 = time.perf_counter()
+        for value in values:
+            log.log(value)
+        t1 = time.perf_counter()
+        print('  %-28s %.03fus'%(name, (t1 - t0) / steps * 1e6))
+
+def benchmark_histogram_log(steps=2**20, batch=1024):
+    '''
+    compares logging values one at a time and in batches with log_many
+    '''
+    values = numpy.random.randn(steps)
+    print('HistogramLog (%i values)'%steps)
+    histogram_log = HistogramLog()
+    t0 = time.perf_counter()
+    for value in values[:steps//16].tolist():
+        histogram_log.log(value)
+    t1 = time.perf_counter()
+    print('  log:      %.03fus per value'%((t1 - t0) / (steps//16) * 1e6))
+    
+    histogram_log = HistogramLog()
+    t0 = time.perf_counter()
+    for start in range(0, steps, batch):
+        histogram_log.log_many(values[start:start+batch])
+    t1 = time.perf_counter()
+    print('  log_many: %.03fus per value (batch=%i)'%(
+        (t1 - t0) / steps * 1e6, batch))
+    print('  median estimate: %.03f'%histogram_log.quantile(0.5))
+
+def benchmark_render(rows=2**17, frames=50, rows_per_frame=256):
+    '''
+    compares the cost of redrawing a growing adaptive log every frame with
+    plot_logs and with a RenderCache using fixed axes
+    '''
+    values = numpy.random.randn(rows + frames * rows_per_frame).cumsum()
+    y_range = (values.min(), values.max())
+    x_axis = (0, len(values))
+    print('Per-frame cost of plotting (%i rows, +%i rows per frame)'%(
+        rows, rows_per_frame))
+    for name in ('plot_logs', 'RenderCache.plot_logs'):
+        log = Log.from_array(values[:rows], capacity='adaptive')
+        if name == 'plot_logs':
+            plot = lambda : plot_logs({'log':log}, y_range=y_range)
+        else:
+            cache = RenderCache()
+            plot = lambda : cache.plot_logs(
+                {'log':log}, x_axis=x_axis, y_range=y_range)
+        plot()
+        elapsed = 0.
+        for i in range(frames):
+            start = rows + i * rows_per_frame
+            log.log_many(values[start:start + rows_per_frame])
+            t0 = time.perf_counter()
+            plot()
+            elapsed += time.perf_counter() - t0
+        print('  %-28s %.03fms'%(name, elapsed / frames * 1e3))
+
+def benchmark_aggregate(runs=20, steps=2**16, capacity=2048, repeats=10):
+    '''
+    compares plotting one line per run with plotting a single aggregated
+    line and band, for runs that compressed different amounts
+    '''
+    logs = {}
+    for i in range(runs):
+        values = numpy.random.randn(steps + i * 1024).cumsum()
+        logs['run_%i'%i] = Log.from_array(values, capacity=capacity)
+    print('Plotting %i runs'%runs)
+    for name, plot in (
+        ('plot_logs', lambda : plot_logs(logs)),
+        ('aggregate_logs', lambda : plot_poly_lines(
+            {'mean' : aggregate_logs(list(logs.values()))})),
+    ):
+        t0 = time.perf_counter()
+        for i in range(repeats):
+            plot()
+        t1 = time.perf_counter()
+        print('  %-28s %.03fms'%(name, (t1 - t0) / repeats * 1e3))
+
+def benchmark_import_time(
+    modules=(
+        'conspiracy',
+        'conspiracy.log',
+        'conspiracy.config',
+        'conspiracy.commandline',
+    ),
+    forbidden=('scipy', 'colorama'),
+):
+    '''
+    measures the cumulative import time of each module in a fresh interpreter
+    with python -X importtime, and raises an AssertionError if importing it
+    also imports any of the forbidden modules, which should only be loaded
+    when they are actually used
+    '''
+    print('Import time')
+    for module in modules:
+        result = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', 'import %s'%module],
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+        cumulative_times = {}
+        for line in result.stderr.splitlines():
+            if not line.startswith('import time:'):
+                continue
+            fields = line[len('import time:'):].split('|')
+            try:
+                cumulative_times[fields[2].strip()] = int(fields[1])
+            except ValueError:
+                # the header line
+                continue
+        
+        print('  %-28s %.01fms'%(module, cumulative_times[module] / 1000))
+        imported = [name for name in forbidden if name in cumulative_times]
+        if imported:
+            raise AssertionError(
+                'importing %s also imports %s'%(module, ', '.join(imported)))
+
+def check_logged_total(log, expected_steps, expected_total):
+    '''
+    checks that no samples were lost, by rebuilding the number of values in
+    each row from the compression, and comparing the sum of all logged
+    (integer) values recovered from the row averages exactly
+    '''
+    contents = log.contents
+    counts = numpy.full(contents.shape[0], log.compression)
+    counts[-1] = log.step - log.compression * (contents.shape[0]-1)
+    assert 0 < counts[-1] <= log.compression, 'bad row count %i'%counts[-1]
+    steps = int(counts.sum())
+    assert steps == expected_steps, 'lost %i steps'%(expected_steps - steps)
+    
+    # the rounding error of the row averages is far below one, so rounding
+    # recovers the exact integer total
+    total = numpy.sum(contents[:,0] * counts)
+    assert abs(total - round(total)) < 0.01, 'total %f is not an integer'%total
+    assert round(total) == expected_total, 'lost samples: %i != %i'%(
+        round(total), expected_total)
+
+def log_range(log, start, end, batch):
+    for i in range(start, end, batch):
+        if batch == 1:
+            log.log(i)
+        else:
+            log.log_many(numpy.arange(i, min(i+batch, end)))
+
+def stress_locked_log(threads=8, values_per_thread=20000, capacity=256):
+    '''
+    logs from many threads at once into a LockedLog
+    '''
+    log = LockedLog(capacity=capacity)
+    workers = [
+        threading.Thread(
+            target=log_range,
+            args=(log, i*values_per_thread, (i+1)*values_per_thread, i%2*7+1),
+        )
+        for i in range(threads)
+    ]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    
+    n = threads * values_per_thread
+    check_logged_total(log, n, n*(n-1)//2)
+    print('LockedLog: %i threads logged %i values, none lost'%(threads, n))
+
+def stress_shared_log(processes=4, values_per_process=20000, capacity=256):
+    '''
+    logs from many processes at once into a SharedLog
+    '''
+    log = SharedLog(capacity=capacity)
+    try:
+        workers = [
+            multiprocessing.Process(
+                target=log_range,
+                args=(
+                    log,
+                    i*values_per_process,
+                    (i+1)*values_per_process,
+                    i%2*7+1,
+                ),
+            )
+            for i in range(processes)
+        ]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        
+        n = processes * values_per_process
+        check_logged_total(log, n, n*(n-1)//2)
+        print('SharedLog: %i processes logged %i values, none lost'%(
+            processes, n))
+    finally:
+        log.unlink()
+
+if __name__ == '__main__':
+    benchmark_import_time()
+    benchmark_compression_latency()
+    benchmark_state_formats()
+    benchmark_fast_log()
+    benchmark_histogram_log()
+    benchmark_render()
+    benchmark_aggregate()
+    stress_locked_log()
+    stress_shared_log()
@@ -0,0 +1,136 @@
+import os
+import json
+import hashlib
+import tempfile
+
+'''
+A persistent on-disk cache for log states extracted from checkpoint files.
+Loading a large checkpoint just to extract one small log is expensive, so the
+binary state of the extracted log is stored in the cache directory, keyed by
+the checkpoint's path, size and modification time along with the keys and
+file format used to extract it.  When the cache grows beyond max_size bytes,
+the least recently used entries are evicted.
+'''
+
+cache_version = 1
+default_cache_directory = os.path.join(
+    os.environ.get('XDG_CACHE_HOME', os.path.join('~', '.cache')),
+    'conspiracy',
+)
+default_max_cache_size = 256 * 2**20
+
+class LogStateCache:
+    def __init__(self,
+        directory=default_cache_directory,
+        max_size=default_max_cache_size,
+    ):
+        self.directory = os.path.expanduser(directory)
+        self.max_size = max_size
+    
+    def entry_path(self, log_path, file_format, keys):
+        '''
+        returns the path of the cache entry for a checkpoint, or None if the
+        checkpoint does not exist
+        '''
+        try:
+            stat = os.stat(log_path)
+        except FileNotFoundError:
+            return None
+        key = json.dumps([
+            cache_version,
+            os.path.abspath(log_path),
+            stat.st_size,
+            stat.st_mtime_ns,
+            list(keys or []),
+            file_format,
+        ])
+        name = hashlib.sha1(key.encode('utf-8')).hexdigest()
+        return os.path.join(self.directory, name + '.state')
+    
+    def get(self, log_path, file_format, keys):
+        '''
+        returns the cached binary state for a checkpoint or None
+        '''
+        entry_path = self.entry_path(log_path, file_format, keys)
+        if entry_path is None:
+            return None
+        try:
+            with open(entry_path, 'rb') as f:
+                state = f.read()
+        except FileNotFoundError:
+            return None
+        
+        # bump the modification time, which is used as the LRU order
+        try:
+            os.utime(entry_path)
+        except OSError:
+            pass
+        return state
+    
+    def put(self, log_path, file_format, keys, state, entry_path=None):
+        '''
+        stores the binary state of a checkpoint
+        
+        entry_path : the entry path computed before the checkpoint was
+                     loaded, if the checkpoint has changed since then the
+                     state may belong to either version, so it is not stored
+        '''
+        current_path = self.entry_path(log_path, file_format, keys)
+        if current_path is None:
+            return
+        if entry_path is None:
+            entry_path = current_path
+        elif entry_path != current_path:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        
+        # write to a temporary file first so that concurrent readers never
+        # see a partial entry
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(state)
+            os.replace(tmp_path, entry_path)
+        except BaseException:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            raise
+    
+    def evict(self):
+        '''
+        removes the least recently used entries until the cache is no larger
+        than max_size
+        '''
+        try:
+            scan = os.scandir(self.directory)
+        except FileNotFoundError:
+            return
+        
+        entries = []
+        with scan:
+            for entry in scan:
+                if not entry.name.endswith('.state'):
+                    continue
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime_ns, stat.st_size, entry.path))
+        
+        total_size = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total_size <= self.max_size:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total_size -= size
+    
+    def clear(self):
+        max_size = self.max_size
+        self.max_size = 0
+        self.evict()
+        self.max_size = max_size
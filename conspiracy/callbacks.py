@@ -0,0 +1,176 @@
+import threading
+from collections import deque
+
+'''
+Log callbacks are functions that are called with (value, step) every time a
+value is logged.  The AsyncLogCallback in this file moves the work of those
+callbacks off of the training loop and onto a background thread.
+'''
+
+default_max_queue = 65536
+default_flush_interval = 1.
+
+class AsyncLogCallback:
+    '''
+    Wraps one or more log callbacks so that they are called from a background
+    thread.  Calling this object only appends (value, step) to a bounded
+    queue.  Every flush_interval seconds (or when the queue fills up) the
+    background thread drains the whole queue and forwards it to the wrapped
+    callbacks in one batch.
+    
+    callbacks      : a callback or list of callbacks taking (value, step)
+    max_queue      : the maximum number of values waiting in the queue
+    flush_interval : the number of seconds between batches
+    aggregate      : forward the mean of every aggregate consecutive values
+                     (using the step of the last one) instead of every value
+    backpressure   : what to do when the queue is full,
+                     'block' waits for the background thread,
+                     'drop_newest' discards the incoming value,
+                     'drop_oldest' discards the oldest queued value
+    
+    Exceptions raised by the callbacks are re-raised by flush and close.
+    '''
+    def __init__(self,
+        callbacks,
+        max_queue=default_max_queue,
+        flush_interval=default_flush_interval,
+        aggregate=1,
+        backpressure='block',
+    ):
+        if callable(callbacks):
+            callbacks = [callbacks]
+        if backpressure not in ('block', 'drop_newest', 'drop_oldest'):
+            raise ValueError(
+                '"backpressure" must be "block", "drop_newest" or '
+                '"drop_oldest"')
+        self.callbacks = list(callbacks)
+        self.max_queue = max_queue
+        self.flush_interval = flush_interval
+        self.aggregate = aggregate
+        self.backpressure = backpressure
+        
+        self.queue = deque()
+        self.condition = threading.Condition()
+        self.enqueued = 0
+        self.processed = 0
+        self.dropped = 0
+        self.flush_requested = False
+        self.closed = False
+        self.exception = None
+        
+        self.aggregate_sum = 0.
+        self.aggregate_count = 0
+        self.aggregate_step = None
+        
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+    
+    def __call__(self, value, step):
+        with self.condition:
+            if self.closed:
+                raise RuntimeError('AsyncLogCallback is closed')
+            while len(self.queue) >= self.max_queue:
+                if self.backpressure == 'block':
+                    self.condition.notify_all()
+                    self.condition.wait()
+                elif self.backpressure == 'drop_newest':
+                    self.dropped += 1
+                    return
+                elif self.backpressure == 'drop_oldest':
+                    self.queue.popleft()
+                    self.dropped += 1
+                    self.processed += 1
+            self.queue.append((value, step))
+            self.enqueued += 1
+            if len(self.queue) >= self.max_queue:
+                self.condition.notify_all()
+    
+    def _run(self):
+        while True:
+            with self.condition:
+                self.condition.wait_for(
+                    lambda: (
+                        self.closed or
+                        self.flush_requested or
+                        len(self.queue) >= self.max_queue
+                    ),
+                    timeout=self.flush_interval,
+                )
+                batch = list(self.queue)
+                self.queue.clear()
+                flush = self.flush_requested or self.closed
+                self.flush_requested = False
+                closed = self.closed
+                # wake any producers waiting for space in the queue
+                self.condition.notify_all()
+            
+            try:
+                self._dispatch(batch, flush)
+            except Exception as e:
+                with self.condition:
+                    if self.exception is None:
+                        self.exception = e
+            
+            with self.condition:
+                self.processed += len(batch)
+                self.condition.notify_all()
+            
+            if closed:
+                return
+    
+    def _dispatch(self, batch, flush):
+        if self.aggregate == 1:
+            for value, step in batch:
+                for callback in self.callbacks:
+                    callback(value, step)
+            return
+        
+        step = None
+        for value, step in batch:
+            self.aggregate_sum += value
+            self.aggregate_count += 1
+            if self.aggregate_count == self.aggregate:
+                self._forward_aggregate(step)
+        
+        if flush and self.aggregate_count:
+            if step is None:
+                step = self.aggregate_step
+            self._forward_aggregate(step)
+        elif step is not None:
+            self.aggregate_step = step
+    
+    def _forward_aggregate(self, step):
+        value = self.aggregate_sum / self.aggregate_count
+        self.aggregate_sum = 0.
+        self.aggregate_count = 0
+        for callback in self.callbacks:
+            callback(value, step)
+    
+    def _raise_exception(self):
+        if self.exception is not None:
+            exception = self.exception
+            self.exception = None
+            raise exception
+    
+    def flush(self):
+        '''
+        blocks until every value queued so far has been forwarded
+        '''
+        with self.condition:
+            if not self.closed:
+                target = self.enqueued
+                self.flush_requested = True
+                self.condition.notify_all()
+                self.condition.wait_for(lambda: self.processed >= target)
+        self._raise_exception()
+    
+    def close(self):
+        '''
+        forwards every queued value and stops the background thread
+        '''
+        with self.condition:
+            if not self.closed:
+                self.closed = True
+                self.condition.notify_all()
+        self.thread.join()
+        self._raise_exception()
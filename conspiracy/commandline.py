@@ -1,154 +1,465 @@
 import os
+import sys
+import time
+import signal
 
 from argparse import ArgumentParser
 import pickle
 import json
 
-from conspiracy.log import Log
-from conspiracy.plot import plot_logs, color_name_to_index
+from conspiracy.log import Log, MemmapLog
+from conspiracy.stream import LogStreamReader
+from conspiracy.discovery import find_logs, DirectoryIndex, default_index_path
+from conspiracy.cache import (
+    LogStateCache, default_cache_directory, default_max_cache_size)
+from conspiracy.plot import plot_logs, plot_poly_lines, color_name_to_index
+from conspiracy.aggregate import aggregate_log_groups
+from conspiracy.dashboard import Dashboard
 
-def plot_logfiles(
+clear_screen = '\033[H\033[J'
+
+def load_checkpoint_data(log_path, file_format, keys):
+    '''
+    loads a checkpoint file and extracts the log state stored at keys
+    '''
+    if file_format == 'pickle':
+        checkpoint_data = pickle.load(open(log_path, 'rb'))
+    elif file_format == 'json':
+        checkpoint_data = json.load(open(log_path))
+    elif file_format == 'binary':
+        checkpoint_data = open(log_path, 'rb').read()
+    elif file_format == 'torch':
+        import torch
+        checkpoint_data = torch.load(
+            log_path, map_location=torch.device('cpu'))
+    for key in keys or []:
+        try:
+            key = int(key)
+        except ValueError:
+            pass
+        try:
+            checkpoint_data = checkpoint_data[key]
+        except KeyError:
+            print(checkpoint_data.keys())
+            raise
+    
+    return checkpoint_data
+
+def ignore_interrupts():
+    '''
+    initializer for worker processes, Ctrl-C is handled by the main process,
+    which shuts the pool down, instead of raising in every worker
+    '''
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+def load_log(log_path, file_format, keys):
+    if file_format == 'memmap':
+        return MemmapLog(log_path, mode='r')
+    elif file_format == 'stream':
+        log = LogStreamReader(log_path).log
+        if log is None:
+            raise ValueError('%s has no log stream header yet'%log_path)
+        return log
+    
+    return Log(state=load_checkpoint_data(log_path, file_format, keys))
+
+def load_log_state(log_path, file_format, keys, skip_incomplete=False):
+    '''
+    loads a checkpoint and returns only the compact binary state of the log
+    stored at keys, so that it is cheap to send back from a worker process
+    
+    skip_incomplete : if True, returns None for files that cannot be parsed
+                      because they are still being written
+    '''
+    try:
+        checkpoint_data = load_checkpoint_data(log_path, file_format, keys)
+    except (EOFError, ValueError, pickle.UnpicklingError):
+        if skip_incomplete:
+            return None
+        raise
+    return Log(state=checkpoint_data).get_state(binary=True)
+
+def load_logs(
     log_paths,
     file_format,
     keys,
+    jobs=1,
+    pool=None,
+    skip_incomplete=False,
+    cache=None,
+):
+    '''
+    loads the log from each checkpoint in log_paths, using jobs worker
+    processes (or an existing pool) to load checkpoints in parallel
+    
+    cache : a LogStateCache that is checked before loading each checkpoint
+            and updated with every checkpoint that had to be loaded
+    
+    returns a dictionary of {log_path:log} in the same order as log_paths
+    '''
+    if cache is not None and file_format not in ('memmap', 'stream'):
+        # the entry paths are computed before loading, so that a checkpoint
+        # rewritten during the load is not cached under its new key
+        entry_paths = {
+            log_path : cache.entry_path(log_path, file_format, keys)
+            for log_path in log_paths
+        }
+        states = {
+            log_path : cache.get(log_path, file_format, keys)
+            for log_path in log_paths
+        }
+        missing = [p for p, state in states.items() if state is None]
+        loaded = load_logs(
+            missing,
+            file_format,
+            keys,
+            jobs=jobs,
+            pool=pool,
+            skip_incomplete=skip_incomplete,
+        )
+        for log_path, log in loaded.items():
+            cache.put(
+                log_path,
+                file_format,
+                keys,
+                log.get_state(binary=True),
+                entry_path=entry_paths[log_path],
+            )
+        if loaded:
+            cache.evict()
+        
+        logs = {}
+        for log_path, state in states.items():
+            if state is not None:
+                logs[log_path] = Log(state=state)
+            elif log_path in loaded:
+                logs[log_path] = loaded[log_path]
+        return logs
+    
+    if file_format in ('memmap', 'stream') or (jobs <= 1 and pool is None):
+        logs = {}
+        for log_path in log_paths:
+            if skip_incomplete:
+                state = load_log_state(
+                    log_path, file_format, keys, skip_incomplete=True)
+                if state is not None:
+                    logs[log_path] = Log(state=state)
+            else:
+                logs[log_path] = load_log(log_path, file_format, keys)
+        return logs
+    
+    def load(pool):
+        states = pool.map(
+            load_log_state,
+            log_paths,
+            [file_format] * len(log_paths),
+            [keys] * len(log_paths),
+            [skip_incomplete] * len(log_paths),
+        )
+        return {
+            log_path : Log(state=state)
+            for log_path, state in zip(log_paths, states)
+            if state is not None
+        }
+    
+    if pool is not None:
+        return load(pool)
+    from concurrent.futures import ProcessPoolExecutor
+    with ProcessPoolExecutor(
+        min(jobs, max(len(log_paths), 1)),
+        initializer=ignore_interrupts,
+    ) as pool:
+        return load(pool)
+
+def plot_loaded_logs(
+    logs,
+    keys,
     height=20,
     width=80,
     x_coord='step',
     x_range=(0., 1.),
+    aggregate=None,
+    aggregate_center='mean',
+    aggregate_band=(25., 75.),
 ):
-    
-    if file_format == 'torch':
-        import torch
+    '''
+    aggregate : if specified, a regular expression used to group the log
+                paths (see aggregate.group_logs), and each group is drawn as
+                a single center line with a band around it instead of one
+                line per log
+    '''
+    if aggregate is not None:
+        lines = aggregate_log_groups(
+            logs,
+            aggregate,
+            x_coord=x_coord,
+            x_range=x_range,
+            center=aggregate_center,
+            band=aggregate_band,
+        )
+    else:
+        lines = logs
     
     all_colors = [
         k for k in color_name_to_index.keys()
         if k != 'WHITE' and k != 'EMPTY'
     ]
+    colors = {
+        name : all_colors[i % len(all_colors)]
+        for i, name in enumerate(lines)
+    }
     
-    logs = {}
-    colors = {}
-    for i, log_path in enumerate(log_paths):
+    plot_kwargs = {
+        'colors' : colors,
+        'title' : '[' + ']['.join(keys or []) + ']',
+        'legend' : True,
+        'border' : 'line',
+        'height' : height,
+        'width' : width,
+        'min_max_y' : True,
+    }
+    if aggregate is not None:
+        return plot_poly_lines(lines, **plot_kwargs)
+    
+    return plot_logs(logs, x_coord=x_coord, x_range=x_range, **plot_kwargs)
+
+def plot_logfiles(
+    log_paths,
+    file_format,
+    keys,
+    height=20,
+    width=80,
+    x_coord='step',
+    x_range=(0., 1.),
+    jobs=1,
+    cache=None,
+    **kwargs,
+):
+    for log_path in log_paths:
         print('Loading: %s'%log_path)
-        if file_format == 'pickle':
-            checkpoint_data = pickle.load(open(log_path, 'rb'))
-        elif file_format == 'json':
-            checkpoint_data = json.load(open(log_path))
-        elif file_format == 'torch':
-            checkpoint_data = torch.load(
-                log_path, map_location=torch.device('cpu'))
-        for key in keys:
-            try:
-                key = int(key)
-            except ValueError:
-                pass
-            try:
-                checkpoint_data = checkpoint_data[key]
-            except KeyError:
-                print(checkpoint_data.keys())
-                raise
-        
-        log = Log(state=checkpoint_data)
-        logs[log_path] = log
-        colors[log_path] = all_colors[i % len(all_colors)]
+    logs = load_logs(log_paths, file_format, keys, jobs=jobs, cache=cache)
     
-    chart = plot_logs(
+    chart = plot_loaded_logs(
         logs,
-        colors=colors,
-        title='[' + ']['.join(keys) + ']',
-        legend=True,
-        border='line',
+        keys,
         height=height,
         width=width,
         x_coord=x_coord,
         x_range=x_range,
-        min_max_y=True,
+        **kwargs,
     )
     print(chart)
 
-def plot_checkpoint():
-    parser = ArgumentParser()
-    parser.add_argument('logs', type=str, nargs='+')
+class LogFileWatcher:
+    '''
+    Keeps the logs loaded from a set of files in memory, and only reloads the
+    files whose modification time or size changed since the last update.
+    Streams are read incrementally and memmaps are followed in place.
+    '''
+    def __init__(self, file_format, keys, jobs=1, cache=None):
+        self.file_format = file_format
+        self.keys = keys
+        self.cache = cache
+        self.logs = {}
+        self.signatures = {}
+        self.readers = {}
+        if jobs > 1 and file_format not in ('memmap', 'stream'):
+            from concurrent.futures import ProcessPoolExecutor
+            self.pool = ProcessPoolExecutor(
+                jobs, initializer=ignore_interrupts)
+        else:
+            self.pool = None
+    
+    def close(self):
+        if self.pool is not None:
+            self.pool.shutdown()
+    
+    def update(self, log_paths):
+        '''
+        refreshes the logs for log_paths and returns True if anything changed
+        '''
+        changed = False
+        for log_path in list(self.logs):
+            if log_path not in log_paths:
+                del self.logs[log_path]
+                self.signatures.pop(log_path, None)
+                self.readers.pop(log_path, None)
+                changed = True
+        
+        reload_signatures = {}
+        for log_path in log_paths:
+            try:
+                stat = os.stat(log_path)
+            except FileNotFoundError:
+                continue
+            signature = (stat.st_mtime_ns, stat.st_size)
+            if self.signatures.get(log_path) == signature:
+                continue
+            
+            if self.file_format == 'stream':
+                if log_path not in self.readers:
+                    self.readers[log_path] = LogStreamReader(log_path)
+                else:
+                    self.readers[log_path].update()
+                if self.readers[log_path].log is None:
+                    # the header has not been written yet, try again later
+                    continue
+                self.logs[log_path] = self.readers[log_path].log
+            elif self.file_format == 'memmap':
+                # the file size only changes when it grows, so compare steps
+                if log_path not in self.logs:
+                    self.logs[log_path] = MemmapLog(log_path, mode='r')
+                step = self.logs[log_path].step
+                signature = (step,)
+            else:
+                reload_signatures[log_path] = signature
+                continue
+            
+            if self.signatures.get(log_path) != signature:
+                self.signatures[log_path] = signature
+                changed = True
+        
+        # files that cannot be parsed are probably still being written, and
+        # will be picked up on a later update
+        reloaded = load_logs(
+            list(reload_signatures),
+            self.file_format,
+            self.keys,
+            pool=self.pool,
+            skip_incomplete=True,
+            cache=self.cache,
+        )
+        for log_path, log in reloaded.items():
+            self.logs[log_path] = log
+            self.signatures[log_path] = reload_signatures[log_path]
+            changed = True
+        
+        return changed
+
+def watch_logfiles(
+    find_log_paths,
+    file_format,
+    keys,
+    refresh=2.,
+    jobs=1,
+    cache=None,
+    **kwargs,
+):
+    '''
+    redraws the chart in place whenever any of the log files change, only
+    rewriting the parts of the chart that changed
+    
+    find_log_paths : a function returning the current list of log paths
+    refresh        : the number of seconds between polls
+    '''
+    watcher = LogFileWatcher(file_format, keys, jobs=jobs, cache=cache)
+    dashboard = Dashboard()
+    sys.stdout.write(clear_screen)
+    try:
+        while True:
+            if watcher.update(find_log_paths()):
+                chart = plot_loaded_logs(watcher.logs, keys, **kwargs)
+                dashboard.update(chart, force=True)
+            time.sleep(refresh)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        dashboard.close()
+        watcher.close()
+
+def add_plot_arguments(parser):
     parser.add_argument('--keys', nargs='*')
     parser.add_argument('--x-coord', type=str, default='step')
     parser.add_argument('--x-range', type=float, nargs=2, default=(0., 1.))
     parser.add_argument('--format', type=str, default='json')
     parser.add_argument('--height', type=int, default=20)
     parser.add_argument('--width', type=int, default=80)
+    parser.add_argument('--watch', action='store_true',
+        help='keep running and redraw whenever the logs change')
+    parser.add_argument('--refresh', type=float, default=2.,
+        help='seconds between checks for changes in --watch mode')
+    parser.add_argument('--jobs', type=int, default=1,
+        help='number of processes used to load checkpoints')
+    parser.add_argument('--no-cache', action='store_true',
+        help='do not use the cache of previously extracted logs')
+    parser.add_argument('--cache-directory', type=str,
+        default=default_cache_directory)
+    parser.add_argument('--cache-size', type=int,
+        default=default_max_cache_size,
+        help='maximum size of the cache in bytes')
+    parser.add_argument('--aggregate', type=str, default=None,
+        help='a regular expression matching the part of the log paths that '
+        'differs between runs (or capturing the group name), each group of '
+        'runs is drawn as one line with a percentile band')
+    parser.add_argument('--aggregate-center', type=str, default='mean',
+        choices=('mean', 'median'))
+    parser.add_argument('--aggregate-band', type=float, nargs=2,
+        default=(25., 75.),
+        help='the lower and upper percentiles of the band')
+
+def plot_or_watch(args, find_log_paths):
+    plot_kwargs = {
+        'height' : args.height,
+        'width' : args.width,
+        'x_coord' : args.x_coord,
+        'x_range' : args.x_range,
+        'jobs' : args.jobs,
+        'aggregate' : args.aggregate,
+        'aggregate_center' : args.aggregate_center,
+        'aggregate_band' : args.aggregate_band,
+        'cache' : None if args.no_cache else LogStateCache(
+            args.cache_directory, args.cache_size),
+    }
+    if args.watch:
+        watch_logfiles(
+            find_log_paths,
+            args.format,
+            args.keys,
+            refresh=args.refresh,
+            **plot_kwargs,
+        )
+    else:
+        plot_logfiles(find_log_paths(), args.format, args.keys, **plot_kwargs)
+
+def plot_checkpoint():
+    parser = ArgumentParser()
+    parser.add_argument('logs', type=str, nargs='+')
+    add_plot_arguments(parser)
     
     args = parser.parse_args()
     
-    plot_logfiles(
-        args.logs,
-        args.format,
-        args.keys,
-        height=args.height,
-        width=args.width,
-        x_coord=args.x_coord,
-        x_range=args.x_range,
-    )
+    plot_or_watch(args, lambda : args.logs)
 
 def plot_directory():
     parser = ArgumentParser()
     parser.add_argument('directory', type=str, nargs='+')
     parser.add_argument('--omit', type=str, nargs='+', default=[])
     parser.add_argument('--name-prefix', type=str, default='log')
-    parser.add_argument('--keys', nargs='*')
-    parser.add_argument('--x-coord', type=str, default='step')
-    parser.add_argument('--x-range', type=float, nargs=2, default=(0., 1.))
-    parser.add_argument('--format', type=str, default='json')
-    parser.add_argument('--height', type=int, default=20)
-    parser.add_argument('--width', type=int, default=80)
+    parser.add_argument('--include', type=str, nargs='+', default=None,
+        help='glob patterns that log file names must match')
+    parser.add_argument('--include-regex', type=str, default=None,
+        help='a regular expression that log file paths must contain')
+    parser.add_argument('--max-depth', type=int, default=None)
+    parser.add_argument('--index', type=str, nargs='?', default=None,
+        const=default_index_path,
+        help='persist directory listings in this file and only re-read '
+        'directories that changed')
+    add_plot_arguments(parser)
     
     args = parser.parse_args()
     
-    all_colors = [
-        k for k in color_name_to_index.keys()
-        if k != 'WHITE' and k != 'EMPTY'
-    ]
-    
-    if args.format == 'torch':
-        import torch
+    if args.index is not None:
+        index = DirectoryIndex(args.index)
+    else:
+        index = None
     
-    def recurse_directory(directory):
-        sub_directories = [
-            os.path.join(directory, d) for d in os.listdir(directory)
-            if os.path.isdir(os.path.join(directory, d))
-            and not any(omit in d for omit in args.omit)
-        ]
-        matching_files = [
-            os.path.join(directory, f) for f in os.listdir(directory)
-            if not os.path.isdir(os.path.join(directory, f))
-            and f.startswith(args.name_prefix)
-        ]
-        
-        for sub_directory in sub_directories:
-            matching_files = matching_files + recurse_directory(sub_directory)
-        
-        return matching_files
-    
-    matching_files = []
-    for directory in args.directory:
-        matching_files = matching_files + recurse_directory(directory)
-    
-    bundled_files = {}
-    for matching_file in matching_files:
-        d, f = os.path.split(matching_file)
-        if d not in bundled_files:
-            bundled_files[d] = []
-        bundled_files[d].append(matching_file)
-    
-    most_recent_files = []
-    for directory, files in bundled_files.items():
-        file_times = [os.path.getmtime(f) for f in files]
-        most_recent_file = max(zip(file_times, files))[1]
-        most_recent_files.append(most_recent_file)
-    
-    plot_logfiles(
-        most_recent_files,
-        args.format,
-        args.keys,
-        height=args.height,
-        width=args.width,
-        x_coord=args.x_coord,
-        x_range=args.x_range,
-    )
+    plot_or_watch(args, lambda : find_logs(
+        args.directory,
+        name_prefix=args.name_prefix,
+        omit=args.omit,
+        include=args.include,
+        include_regex=args.include_regex,
+        max_depth=args.max_depth,
+        jobs=args.jobs,
+        index=index,
+    ))
@@ -0,0 +1,208 @@
+import re
+import sys
+import time
+
+'''
+A Dashboard keeps a text_image (see plot.py) on screen and redraws it in
+place.  Instead of printing every new frame, it remembers the cells of the
+previous frame and only rewrites the cells that changed, moving the cursor
+with relative escape codes so that it works anywhere in the terminal without
+clearing the screen or filling up the scrollback.
+'''
+
+escape_pattern = re.compile('(\033\\[[0-9;]*m)')
+reset = '\033[0m'
+
+def parse_style(codes, style):
+    '''
+    updates a (foreground, background, intensity) style with the parameters
+    of a single SGR escape code
+    '''
+    foreground, background, intensity = style
+    for code in codes.split(';'):
+        code = int(code or 0)
+        if code == 0:
+            foreground, background, intensity = None, None, None
+        elif 30 <= code <= 39 or 90 <= code <= 97:
+            foreground = code
+        elif 40 <= code <= 49 or 100 <= code <= 107:
+            background = code
+        elif code in (1, 2, 22):
+            intensity = code
+    return foreground, background, intensity
+
+def style_to_escape(style):
+    codes = [str(code) for code in style if code is not None]
+    return '\033[%sm'%';'.join(['0'] + codes)
+
+def text_to_cells(text):
+    '''
+    converts text containing colorama escape codes into a list of lines, where
+    each line is a list of (style, character) cells
+    '''
+    lines = []
+    style = (None, None, None)
+    for line in text.split('\n'):
+        cells = []
+        for piece in escape_pattern.split(line):
+            if piece.startswith('\033['):
+                style = parse_style(piece[2:-1], style)
+            else:
+                cells.extend((style, char) for char in piece)
+        lines.append(cells)
+    return lines
+
+class Dashboard:
+    '''
+    Owns the region of the terminal starting at the cursor position when it
+    is first drawn, and keeps it up to date with the most recent frame.
+    
+    stream  : the file to write to (sys.stdout by default)
+    max_fps : the maximum number of frames drawn per second, frames updated
+              faster than this are held back until the next update or flush
+    
+    Lines longer than the width of the terminal wrap and confuse the cursor
+    movement, so frames should be narrower than the terminal.
+    '''
+    def __init__(self, stream=None, max_fps=10.):
+        self.stream = stream
+        self.max_fps = max_fps
+        self.cells = None
+        self.cursor = (0, 0)
+        self.pending = None
+        self.last_draw = None
+    
+    def update(self, text, force=False):
+        '''
+        sets the text that should be displayed and draws it unless the last
+        frame was drawn too recently
+        
+        returns True if the frame was drawn
+        '''
+        self.pending = text
+        now = time.monotonic()
+        if (
+            not force and
+            self.max_fps and
+            self.last_draw is not None and
+            now - self.last_draw < 1. / self.max_fps
+        ):
+            return False
+        
+        self.flush()
+        return True
+    
+    def flush(self):
+        '''
+        draws the most recent frame if it has not been drawn yet
+        '''
+        if self.pending is None:
+            return
+        
+        cells = text_to_cells(self.pending)
+        self.pending = None
+        self.last_draw = time.monotonic()
+        if self.cells is None:
+            output = self._draw_all(cells)
+        else:
+            output = self._draw_changes(cells)
+        self.cells = cells
+        
+        if output:
+            stream = self.stream or sys.stdout
+            stream.write(output)
+            stream.flush()
+    
+    def close(self):
+        '''
+        draws any frame that was held back and moves the cursor below the
+        dashboard
+        '''
+        self.flush()
+        if self.cells is not None:
+            stream = self.stream or sys.stdout
+            stream.write(reset + '\n')
+            stream.flush()
+            self.cells = None
+    
+    def _draw_all(self, cells):
+        output = []
+        for i, line in enumerate(cells):
+            if i:
+                output.append('\n')
+            output.append(self._write_cells(line, None))
+        output.append(reset)
+        self.cursor = (len(cells)-1, len(cells[-1]))
+        return ''.join(output)
+    
+    def _move(self, row, column):
+        current_row, current_column = self.cursor
+        move = []
+        if row < current_row:
+            move.append('\033[%iA'%(current_row - row))
+        elif row > current_row:
+            move.append('\033[%iB'%(row - current_row))
+        if column != current_column:
+            move.append('\r')
+            if column:
+                move.append('\033[%iC'%column)
+        self.cursor = (row, column)
+        return ''.join(move)
+    
+    def _write_cells(self, cells, style):
+        output = []
+        for cell_style, char in cells:
+            if cell_style != style:
+                output.append(style_to_escape(cell_style))
+                style = cell_style
+            output.append(char)
+        return ''.join(output)
+    
+    def _draw_changes(self, cells):
+        output = []
+        old_cells = self.cells
+        for row, line in enumerate(cells[:len(old_cells)]):
+            old_line = old_cells[row]
+            if line == old_line:
+                continue
+            
+            # find runs of changed cells, and merge runs separated by only a
+            # few unchanged cells, since moving the cursor costs about as much
+            changed = [
+                column for column in range(len(line))
+                if column >= len(old_line) or line[column] != old_line[column]
+            ]
+            runs = []
+            for column in changed:
+                if runs and column - runs[-1][1] <= 4:
+                    runs[-1][1] = column + 1
+                else:
+                    runs.append([column, column + 1])
+            
+            for start, end in runs:
+                output.append(self._move(row, start))
+                output.append(self._write_cells(line[start:end], None))
+                output.append(reset)
+                self.cursor = (row, end)
+            
+            if len(line) < len(old_line):
+                output.append(self._move(row, len(line)))
+                output.append('\033[K')
+        
+        # add new lines below the old frame
+        if len(cells) > len(old_cells):
+            output.append(self._move(len(old_cells)-1, len(old_cells[-1])))
+            for row in range(len(old_cells), len(cells)):
+                output.append('\n')
+                output.append(self._write_cells(cells[row], None))
+                output.append(reset)
+                self.cursor = (row, len(cells[row]))
+        
+        # clear lines that are no longer part of the frame
+        elif len(cells) < len(old_cells):
+            for row in range(len(cells), len(old_cells)):
+                output.append(self._move(row, 0))
+                output.append('\033[K')
+        
+        output.append(self._move(len(cells)-1, len(cells[-1])))
+        return ''.join(output)
@@ -0,0 +1,188 @@
+import os
+import re
+import json
+import fnmatch
+import tempfile
+
+'''
+Finds the log files of many runs stored in a tree of directories.  Each
+directory is read with a single os.scandir call, and the directory listings
+can optionally be persisted in an index file so that later searches only
+re-read the directories whose modification time has changed.
+'''
+
+default_index_path = os.path.join(
+    os.environ.get('XDG_CACHE_HOME', os.path.join('~', '.cache')),
+    'conspiracy',
+    'directory_index.json',
+)
+
+def scan_directory(directory):
+    '''
+    returns the sorted names of the subdirectories and files in directory,
+    and a dictionary of {name:DirEntry} for the files, so that their stat
+    results (cached by the DirEntry) can be reused
+    '''
+    directories = []
+    files = []
+    file_entries = {}
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            try:
+                if entry.is_dir():
+                    directories.append(entry.name)
+                else:
+                    files.append(entry.name)
+                    file_entries[entry.name] = entry
+            except OSError:
+                continue
+    directories.sort()
+    files.sort()
+    return directories, files, file_entries
+
+class DirectoryIndex:
+    '''
+    A persistent cache of directory listings, keyed by directory path and
+    invalidated when the directory's modification time changes.
+    '''
+    def __init__(self, path=default_index_path):
+        self.path = os.path.expanduser(path)
+        self.changed = False
+        try:
+            with open(self.path) as f:
+                self.entries = json.load(f)
+        except (FileNotFoundError, json.decoder.JSONDecodeError):
+            self.entries = {}
+    
+    def scan_directory(self, directory):
+        mtime = os.stat(directory).st_mtime_ns
+        entry = self.entries.get(directory)
+        if entry is not None and entry['mtime'] == mtime:
+            # the file modification times may have changed since the
+            # listing was stored, so there are no DirEntry objects to reuse
+            return entry['directories'], entry['files'], {}
+        
+        directories, files, file_entries = scan_directory(directory)
+        self.entries[directory] = {
+            'mtime' : mtime,
+            'directories' : directories,
+            'files' : files,
+        }
+        self.changed = True
+        return directories, files, file_entries
+    
+    def save(self):
+        if not self.changed:
+            return
+        directory = os.path.dirname(self.path)
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        with os.fdopen(fd, 'w') as f:
+            json.dump(self.entries, f)
+        os.replace(tmp_path, self.path)
+        self.changed = False
+
+def find_logs(
+    directories,
+    name_prefix='log',
+    omit=(),
+    include=None,
+    include_regex=None,
+    max_depth=None,
+    jobs=1,
+    index=None,
+):
+    '''
+    finds the most recent matching log file in every directory below the
+    given directories
+    
+    name_prefix   : files must start with this prefix
+    omit          : skip subdirectories whose name contains any of these
+    include       : glob patterns, if given files must match at least one
+    include_regex : a regular expression that file paths must contain
+    max_depth     : the maximum depth to search below each directory
+                    (0 only searches the directories themselves)
+    jobs          : the number of threads used to search the top-level
+                    subdirectories in parallel
+    index         : a DirectoryIndex used to skip re-reading directories
+                    that have not changed
+    
+    returns a list of paths, one per directory containing matching files
+    '''
+    if include_regex is not None:
+        include_regex = re.compile(include_regex)
+    if index is not None:
+        scan = index.scan_directory
+    else:
+        scan = scan_directory
+    
+    def matches(path, name):
+        if not name.startswith(name_prefix):
+            return False
+        if include and not any(fnmatch.fnmatch(name, p) for p in include):
+            return False
+        if include_regex is not None and not include_regex.search(path):
+            return False
+        return True
+    
+    def most_recent(directory, files, file_entries):
+        candidates = [
+            (os.path.join(directory, f), f) for f in files
+            if matches(os.path.join(directory, f), f)
+        ]
+        if len(candidates) <= 1:
+            return [path for path, name in candidates]
+        file_times = []
+        for path, name in candidates:
+            try:
+                if name in file_entries:
+                    stat = file_entries[name].stat()
+                else:
+                    stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            file_times.append((stat.st_mtime, path))
+        return [max(file_times)[1]] if file_times else []
+    
+    def subdirectories(directory, names):
+        return [
+            os.path.join(directory, d) for d in names
+            if not any(o in d for o in omit)
+        ]
+    
+    def search(directory, depth, found):
+        try:
+            names, files, file_entries = scan(directory)
+        except (FileNotFoundError, NotADirectoryError, PermissionError):
+            return found
+        found.extend(most_recent(directory, files, file_entries))
+        if max_depth is None or depth < max_depth:
+            for sub_directory in subdirectories(directory, names):
+                search(sub_directory, depth+1, found)
+        return found
+    
+    found = []
+    for directory in directories:
+        if jobs <= 1 or max_depth == 0:
+            search(directory, 0, found)
+            continue
+        
+        # search each top-level subdirectory on its own thread
+        try:
+            names, files, file_entries = scan(directory)
+        except (FileNotFoundError, NotADirectoryError, PermissionError):
+            continue
+        found.extend(most_recent(directory, files, file_entries))
+        from concurrent.futures import ThreadPoolExecutor
+        with ThreadPoolExecutor(jobs) as pool:
+            results = pool.map(
+                lambda d : search(d, 1, []),
+                subdirectories(directory, names),
+            )
+            for result in results:
+                found.extend(result)
+    
+    if index is not None:
+        index.save()
+    
+    return found
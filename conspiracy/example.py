@@ -5,6 +5,7 @@ import pickle
 
 from conspiracy.log import Log
 from conspiracy.plot import plot_logs, plot_logs_grid
+from conspiracy.dashboard import Dashboard
 
 # make some data
 cos = Log()
@@ -136,3 +137,20 @@ for epoch in range(1,11):
         windowed_mean_std=100,
     )
     print(plot)
+
+# redraw a live plot in place, only rewriting the characters that changed
+dashboard = Dashboard(max_fps=10)
+live = Log(capacity=1024)
+for i in range(20000):
+    live.log(math.sin(i/2000 * math.pi) + random.random() * 0.25)
+    if i % 100 == 0:
+        dashboard.update(plot_logs(
+            {'live':live},
+            colors={'live':'GREEN'},
+            border='line',
+            legend=True,
+            min_max_y=True,
+            width=80,
+            height=20,
+        ))
+dashboard.close()
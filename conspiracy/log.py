@@ -1,17 +1,307 @@
+import os
 import math
 import time
+import json
+import struct
+import threading
 
 import numpy
 
-from conspiracy.plot import plot_poly_lines, grid
+from conspiracy.plot import envelope_poly_line
+from conspiracy.callbacks import AsyncLogCallback
+
+state_magic = b'CNSPSTAT'
+state_version = 1
+state_header = struct.Struct('<8sII')
+def encode_state(state):
+    '''
+    encodes a state dictionary as a compact binary buffer
+    
+    layout:
+    header : magic (8 bytes), version (uint32), json length (uint32)
+    json   : the non-array entries of the state, and the name, dtype, shape
+             and byte offset of each array entry
+    arrays : the raw little-endian contents of each array entry
+    '''
+    fields = {}
+    arrays = []
+    buffers = []
+    offset = 0
+    for name, value in state.items():
+        if isinstance(value, numpy.ndarray):
+            dtype = value.dtype.newbyteorder('<')
+            buffer = numpy.ascontiguousarray(value, dtype=dtype).tobytes()
+            arrays.append([name, dtype.str, list(value.shape), offset])
+            buffers.append(buffer)
+            offset += len(buffer)
+        else:
+            fields[name] = value
+    
+    header = json.dumps({'fields':fields, 'arrays':arrays}).encode('utf-8')
+    return b''.join(
+        [state_header.pack(state_magic, state_version, len(header)), header] +
+        buffers
+    )
+
+def decode_state(buffer):
+    '''
+    decodes a binary buffer generated by encode_state
+    '''
+    buffer = memoryview(buffer)
+    magic, version, header_length = state_header.unpack_from(buffer)
+    if magic != state_magic:
+        raise ValueError('buffer does not contain a conspiracy state')
+    if version != state_version:
+        raise ValueError('unsupported state version: %i'%version)
+    start = state_header.size
+    header = json.loads(bytes(buffer[start:start+header_length]))
+    start += header_length
+    
+    state = header['fields']
+    for name, dtype, shape, offset in header['arrays']:
+        count = math.prod(shape)
+        state[name] = numpy.frombuffer(
+            buffer, dtype=dtype, count=count, offset=start+offset,
+        ).reshape(shape)
+    
+    return state
+
+def is_binary_state(state):
+    return isinstance(state, (bytes, bytearray, memoryview))
+
+def finalize_state(state, binary):
+    '''
+    converts a state dictionary containing numpy arrays into either the
+    binary encoding or a dictionary of python lists
+    '''
+    if binary:
+        return encode_state(state)
+    return {
+        name : value.tolist() if isinstance(value, numpy.ndarray) else value
+        for name, value in state.items()
+    }
+
+def fold_items(data, rows, items, n0, c, statistics=None):
+    '''
+    folds consecutive items into the running averages stored in data
+    
+    data       : the array of running averages
+    rows       : the row of data that each item is averaged into
+    items      : the items to fold in, where items[i] is the (n0+i)%c-th item
+                 of its row, and each row averages c items
+    statistics : an optional array of per-row (count, min, max, m2) statistics
+                 of the first item column to update along with data
+    '''
+    # each row must see its items in order, so update all rows that
+    # receive their n-th item together, for increasing n
+    m = items.shape[0]
+    positions = numpy.unique((n0 + numpy.arange(min(m, c))) % c)
+    for n in positions.tolist():
+        i = (n - n0) % c
+        r = rows[i::c]
+        old_mean = data[r,0]
+        data[r] = (data[r] * n + items[i::c])/(n+1)
+        if statistics is not None:
+            x = items[i::c,0]
+            s = statistics[r]
+            if n:
+                s[:,1] = numpy.minimum(s[:,1], x)
+                s[:,2] = numpy.maximum(s[:,2], x)
+                s[:,3] += (x - old_mean) * (x - data[r,0])
+            else:
+                s[:,1] = x
+                s[:,2] = x
+                s[:,3] = 0.
+            s[:,0] = n+1
+            statistics[r] = s
+
+class RunningSmoother:
+    '''
+    Computes smoothed versions of a stream of values as they arrive, without
+    looking at the history again: the mean and standard deviation over a
+    trailing window of values (using Welford-style updates that add the new
+    value and remove the one leaving the window), and an exponential moving
+    average.
+    
+    window    : the number of most recent values in the rolling window
+    half_life : the number of values after which the weight of a value in the
+                exponential moving average has halved
+    '''
+    def __init__(self, window=100, half_life=50., state=None):
+        self.window = int(window)
+        self.half_life = float(half_life)
+        self.values = numpy.zeros(self.window)
+        self.position = 0
+        self.count = 0
+        self.mean = 0.
+        self.m2 = 0.
+        self.ema = None
+        
+        if state is not None:
+            self.set_state(state)
+    
+    def get_alpha(self):
+        return 1. - 0.5 ** (1. / self.half_life)
+    
+    alpha = property(get_alpha)
+    
+    def _state(self):
+        return {
+            'window' : self.window,
+            'half_life' : self.half_life,
+            'values' : self.recent_values(),
+            'mean' : self.mean,
+            'm2' : self.m2,
+            'ema' : self.ema,
+        }
+    
+    def set_state(self, state):
+        self.window = int(state['window'])
+        self.half_life = float(state['half_life'])
+        recent_values = numpy.array(state['values'], dtype=float)
+        self.values = numpy.zeros(self.window)
+        self.values[:len(recent_values)] = recent_values
+        self.count = len(recent_values)
+        self.position = self.count % self.window
+        self.mean = state['mean']
+        self.m2 = state['m2']
+        self.ema = state['ema']
+    
+    def recent_values(self):
+        '''
+        returns the values in the window, oldest first
+        '''
+        if self.count < self.window:
+            return self.values[:self.count].copy()
+        return numpy.roll(self.values, -self.position)
+    
+    def update(self, value):
+        '''
+        adds a single value and returns the (mean, std, ema) after it
+        '''
+        if self.count < self.window:
+            self.count += 1
+            delta = value - self.mean
+            self.mean += delta / self.count
+            self.m2 += delta * (value - self.mean)
+        else:
+            old_value = float(self.values[self.position])
+            old_mean = self.mean
+            self.mean += (value - old_value) / self.window
+            self.m2 += (value - old_value) * (
+                value - self.mean + old_value - old_mean)
+        self.values[self.position] = value
+        self.position = (self.position + 1) % self.window
+        
+        if self.ema is None:
+            self.ema = value
+        else:
+            self.ema += self.alpha * (value - self.ema)
+        
+        return self.mean, (max(self.m2, 0.) / self.count)**0.5, self.ema
+    
+    def update_many(self, values, chunk_size=4096):
+        '''
+        adds an array of values and returns an (n, 3) array of the
+        (mean, std, ema) after each one
+        
+        The results match calling update on each value up to floating point
+        rounding.
+        '''
+        values = numpy.asarray(values, dtype=float).reshape(-1)
+        m = values.shape[0]
+        smoothed = numpy.zeros((m, 3))
+        if not m:
+            return smoothed
+        
+        # rolling mean/std from cumulative sums over chunks, each preceded by
+        # the values still in the window, and shifted by the chunk mean to
+        # keep the sums of squares small
+        w = self.window
+        history = self.recent_values()
+        for start in range(0, m, chunk_size):
+            chunk = values[start:start+chunk_size]
+            x = numpy.concatenate((history, chunk))
+            h = history.shape[0]
+            shift = chunk.mean()
+            s = numpy.zeros(x.shape[0] + 1)
+            s2 = numpy.zeros(x.shape[0] + 1)
+            numpy.cumsum(x - shift, out=s[1:])
+            numpy.cumsum((x - shift)**2, out=s2[1:])
+            end = numpy.arange(h + 1, x.shape[0] + 1)
+            begin = numpy.maximum(end - w, 0)
+            count = end - begin
+            mean = (s[end] - s[begin]) / count
+            variance = (s2[end] - s2[begin]) / count - mean**2
+            smoothed[start:start+chunk_size,0] = mean + shift
+            smoothed[start:start+chunk_size,1] = numpy.maximum(
+                variance, 0.)**0.5
+            history = x[-w:]
+        
+        # the running mean/m2 are recomputed exactly from the final window
+        self.count = history.shape[0]
+        self.values[:self.count] = history
+        self.position = self.count % w
+        self.mean = float(history.mean())
+        self.m2 = float(((history - self.mean)**2).sum())
+        
+        # the exponential moving average within each chunk is the decayed
+        # previous average plus a lower-triangular filter of the chunk
+        alpha = self.alpha
+        decay = 1. - alpha
+        if self.ema is None:
+            self.ema = float(values[0])
+            first = 1
+            smoothed[0,2] = self.ema
+        else:
+            first = 0
+        k = min(256, m)
+        lags = numpy.arange(k)[:,None] - numpy.arange(k)[None,:]
+        weights = numpy.where(
+            lags >= 0, alpha * decay**numpy.maximum(lags, 0), 0.)
+        carry = decay**numpy.arange(1, k+1)
+        for start in range(first, m, k):
+            chunk = values[start:start+k]
+            n = chunk.shape[0]
+            ema = carry[:n] * self.ema + weights[:n,:n] @ chunk
+            smoothed[start:start+n,2] = ema
+            self.ema = float(ema[-1])
+        
+        return smoothed
 
 default_capacity = 2048
 class Log:
+    # a LogStreamWriter that receives every completed row, see stream_to
+    stream = None
+    
+    # the RunningSmoother and per-row smoothed values, see smoothing_window
+    smoother = None
+    smoothing = None
+    
     def __init__(self,
         capacity=default_capacity,
         state=None,
         log_callbacks=None,
+        statistics=False,
+        smoothing_window=None,
+        smoothing_half_life=None,
     ):
+        '''
+        capacity            : the number of rows to store before compressing,
+                              or 'adaptive' to grow forever
+        state               : a state generated by get_state to restore
+        log_callbacks       : functions called with (value, step) for each
+                              value
+        statistics          : if True, also tracks the count, min, max and
+                              variance of the values averaged into each row
+        smoothing_window    : if specified, also tracks the mean and std of
+                              the values over a rolling window of this size,
+                              and an exponential moving average, averaged
+                              into each row like the values themselves
+        smoothing_half_life : the half life of the exponential moving
+                              average (defaults to half the window, and the
+                              window defaults to twice the half life)
+        '''
         self.capacity = capacity
         self.step = 0
         if capacity == 'adaptive':
@@ -20,6 +310,19 @@ class Log:
             c = capacity
         self.data = numpy.zeros((c, 3))
         self.compression = 1
+        if statistics:
+            self.statistics = numpy.zeros((c, 4))
+        else:
+            self.statistics = None
+        if smoothing_window is not None or smoothing_half_life is not None:
+            if smoothing_window is None:
+                smoothing_window = max(round(smoothing_half_life * 2), 1)
+            if smoothing_half_life is None:
+                smoothing_half_life = smoothing_window / 2
+            self.smoother = RunningSmoother(
+                smoothing_window, smoothing_half_life)
+            self.smoothing = numpy.zeros((c, 3))
+        self._allocate_compress_buffer()
         
         if state is not None:
             self.set_state(state)
@@ -28,49 +331,340 @@ class Log:
             log_callbacks = []
         self.log_callbacks = log_callbacks
         
-    def get_state(self):
-        return {
+    def get_state(self, binary=False):
+        '''
+        binary : if True, the state is encoded as a compact bytes object using
+                 encode_state instead of a dictionary of python lists
+        '''
+        return finalize_state(self._state(), binary)
+    
+    def _state(self):
+        state = {
             'capacity' : self.capacity,
             'step' : self.step,
-            'data' : self.data.tolist(),
+            'data' : self.data,
             'compression' : self.compression,
         }
+        if self.statistics is not None:
+            state['statistics'] = self.statistics
+        if self.smoother is not None:
+            state['smoothing'] = self.smoothing
+            for name, value in self.smoother._state().items():
+                state['smoother_' + name] = value
+        return state
 
     def set_state(self, state):
+        if is_binary_state(state):
+            state = decode_state(state)
         self.capacity = state['capacity']
         self.step = state['step']
-        self.data = numpy.array(state['data'])
+        self.data = numpy.array(state['data'], dtype=float)
         self.compression = state['compression']
+        if 'statistics' in state:
+            self.statistics = numpy.array(state['statistics'], dtype=float)
+        else:
+            self.statistics = None
+        if 'smoothing' in state:
+            self.smoothing = numpy.array(state['smoothing'], dtype=float)
+            self.smoother = RunningSmoother(state={
+                name[len('smoother_'):] : value
+                for name, value in state.items()
+                if name.startswith('smoother_')
+            })
+        else:
+            self.smoothing = None
+            self.smoother = None
+        self._allocate_compress_buffer()
 
     def log(self, value):
         value = float(value)
         row = self.step // self.compression
         if row >= self.data.shape[0]:
             if self.capacity == 'adaptive':
-                self.data = numpy.concatenate(
-                    (self.data, numpy.zeros_like(self.data)), axis=0)
+                self.grow(row + 1)
             else:
-                self.compression = self.compression * 2
-                compressed_log = (self.data[0::2] + self.data[1::2]) / 2.
-                empty = numpy.zeros((self.capacity//2, 3))
-                self.data = numpy.concatenate((compressed_log, empty), axis=0)
+                self.compress()
                 row = self.step // self.compression
         n = self.step % self.compression
         item = [value, float(self.step), time.time()]
+        old_mean = self.data[row,0]
         self.data[row] = (self.data[row] * n + item)/(n+1)
         
+        if self.statistics is not None:
+            stats = self.statistics[row]
+            if n:
+                stats[1] = min(stats[1], value)
+                stats[2] = max(stats[2], value)
+                stats[3] += (value - old_mean) * (value - self.data[row,0])
+            else:
+                stats[1:] = (value, value, 0.)
+            stats[0] = n+1
+        
+        if self.smoother is not None:
+            self.smoothing[row] = (
+                self.smoothing[row] * n + self.smoother.update(value))/(n+1)
+        
+        if self.stream is not None and n+1 == self.compression:
+            self.stream.write_rows(row, row+1)
+        
         for log_callback in self.log_callbacks:
             log_callback(value, self.step)
         
         self.step += 1
+        if row % 2 and n+1 == self.compression:
+            self._fold_pairs()
+    
+    def log_many(self, values, timestamps=None):
+        '''
+        logs an entire array of values in one vectorized pass
+        
+        values     : an array of values, logged in order
+        timestamps : an array of timestamps, one per value
+                     (None will use the current time for every value)
+        
+        The resulting data/compression/step are identical to calling log on
+        each value in a loop.
+        '''
+        values = numpy.asarray(values, dtype=float).reshape(-1)
+        if timestamps is None:
+            timestamps = numpy.full(values.shape[0], time.time())
+        else:
+            timestamps = numpy.asarray(timestamps, dtype=float).reshape(-1)
+            if timestamps.shape != values.shape:
+                raise ValueError(
+                    'timestamps must have the same length as values')
+        
+        first_step = self.step
+        start = 0
+        while start < values.shape[0]:
+            if self.capacity == 'adaptive':
+                rows = self.step + values.shape[0] - start
+                if rows > self.data.shape[0]:
+                    self.grow(rows)
+            elif self.step // self.compression >= self.data.shape[0]:
+                self.compress()
+            
+            # log everything that fits before the next compression
+            end = self.data.shape[0] * self.compression - self.step
+            end = min(values.shape[0], start + end)
+            self._fold(values[start:end], timestamps[start:end])
+            start = end
+        
+        if self.log_callbacks:
+            for step, value in enumerate(values.tolist(), start=first_step):
+                for log_callback in self.log_callbacks:
+                    log_callback(value, step)
+    
+    def _fold(self, values, timestamps):
+        '''
+        folds values into the running row averages without crossing a
+        compression boundary
+        '''
+        m = values.shape[0]
+        if not m:
+            return
+        c = self.compression
+        steps = numpy.arange(self.step, self.step + m)
+        items = numpy.stack((values, steps.astype(float), timestamps), axis=1)
+        fold_items(
+            self.data,
+            steps // c,
+            items,
+            self.step % c,
+            c,
+            statistics=self.statistics,
+        )
+        if self.smoother is not None:
+            fold_items(
+                self.smoothing,
+                steps // c,
+                self.smoother.update_many(values),
+                self.step % c,
+                c,
+            )
+        
+        if self.stream is not None:
+            self.stream.write_rows(self.step // c, (self.step + m) // c)
+        
+        self.step += m
+        self._fold_pairs()
+    
+    @classmethod
+    def from_array(cls, values, timestamps=None, **kwargs):
+        '''
+        builds a new log containing an entire array of values
+        '''
+        log = cls(**kwargs)
+        log.log_many(values, timestamps=timestamps)
+        return log
+    
+    def grow(self, rows):
+        '''
+        extends an adaptive log so that it can hold at least rows entries
+        by repeatedly doubling its size
+        '''
+        new_rows = self.data.shape[0]
+        while new_rows < rows:
+            new_rows *= 2
+        data = numpy.zeros((new_rows, 3))
+        data[:self.data.shape[0]] = self.data
+        self.data = data
+        if self.statistics is not None:
+            statistics = numpy.zeros((new_rows, 4))
+            statistics[:self.statistics.shape[0]] = self.statistics
+            self.statistics = statistics
+        if self.smoothing is not None:
+            smoothing = numpy.zeros((new_rows, 3))
+            smoothing[:self.smoothing.shape[0]] = self.smoothing
+            self.smoothing = smoothing
+    
+    def _allocate_compress_buffer(self):
+        self._folded_pairs = 0
+        self._folded_compression = self.compression
+        if self.capacity == 'adaptive':
+            self._compress_buffer = None
+            self._compress_statistics = None
+            self._compress_smoothing = None
+            return
+        
+        half = self.data.shape[0]//2
+        self._compress_buffer = numpy.zeros((half, 3))
+        if self.statistics is not None:
+            self._compress_statistics = numpy.zeros((half, 4))
+        else:
+            self._compress_statistics = None
+        if self.smoothing is not None:
+            self._compress_smoothing = numpy.zeros((half, 3))
+        else:
+            self._compress_smoothing = None
+    
+    def _fold_pairs(self):
+        '''
+        averages each pair of completed rows into the compress buffers as
+        soon as both rows are complete, so that the work of compress is
+        spread over the calls that fill the log, and compress itself only
+        has to copy the buffers back
+        '''
+        buffer = self._compress_buffer
+        if buffer is None:
+            return
+        
+        # the rows were rewritten by a compress in another process
+        if self._folded_compression != self.compression:
+            self._folded_pairs = 0
+            self._folded_compression = self.compression
+        
+        start = self._folded_pairs
+        end = min(self.step // self.compression // 2, buffer.shape[0])
+        if end <= start:
+            return
+        a = slice(start*2, end*2, 2)
+        b = slice(start*2+1, end*2, 2)
+        
+        if self.statistics is not None:
+            # merge the statistics of each pair of rows before their means
+            # are averaged together
+            sa = self.statistics[a]
+            sb = self.statistics[b]
+            merged = self._compress_statistics[start:end]
+            numpy.add(sa[:,0], sb[:,0], out=merged[:,0])
+            numpy.minimum(sa[:,1], sb[:,1], out=merged[:,1])
+            numpy.maximum(sa[:,2], sb[:,2], out=merged[:,2])
+            delta = self.data[b,0] - self.data[a,0]
+            merged[:,3] = (
+                sa[:,3] + sb[:,3] + delta**2 * sa[:,0] * sb[:,0] / merged[:,0])
+        
+        if self.smoothing is not None:
+            half = self._compress_smoothing[start:end]
+            numpy.add(self.smoothing[a], self.smoothing[b], out=half)
+            numpy.multiply(half, 0.5, out=half)
+        
+        half = buffer[start:end]
+        numpy.add(self.data[a], self.data[b], out=half)
+        numpy.multiply(half, 0.5, out=half)
+        self._folded_pairs = end
+    
+    def compress(self):
+        '''
+        halves the resolution of a full log, averaging pairs of rows
+        
+        This happens in place, so the data buffer of a fixed-capacity log is
+        never reallocated.  The pairs have already been averaged by
+        _fold_pairs while the log filled up, so this is only a copy.
+        '''
+        self._fold_pairs()
+        
+        half = self._compress_buffer
+        rows = half.shape[0]
+        self.data[:rows] = half
+        self.data[rows:] = 0.
+        if self.statistics is not None:
+            self.statistics[:rows] = self._compress_statistics
+            self.statistics[rows:] = 0.
+        if self.smoothing is not None:
+            self.smoothing[:rows] = self._compress_smoothing
+            self.smoothing[rows:] = 0.
+        
+        self.compression = self.compression * 2
+        self._folded_pairs = 0
+        self._folded_compression = self.compression
+        if self.stream is not None:
+            self.stream.write_compress()
     
     def add_log_callback(self, log_callback):
         self.log_callbacks.append(log_callback)
     
-    def add_tensorboard_log_callback(self, writer, name):
+    def add_async_log_callback(self, log_callback, **kwargs):
+        '''
+        adds a callback that is called from a background thread in batches,
+        see AsyncLogCallback for the available keyword arguments
+        '''
+        async_log_callback = AsyncLogCallback(log_callback, **kwargs)
+        self.add_log_callback(async_log_callback)
+        return async_log_callback
+    
+    def add_tensorboard_log_callback(self,
+        writer,
+        name,
+        asynchronous=False,
+        **kwargs,
+    ):
         def log_tensorboard(value, step):
             writer.add_scalar(name, value, step)
-        self.add_log_callback(log_tensorboard)
+        if asynchronous:
+            return self.add_async_log_callback(log_tensorboard, **kwargs)
+        else:
+            self.add_log_callback(log_tensorboard)
+    
+    def stream_to(self, path, **kwargs):
+        '''
+        streams every completed row of this log to an append-only file at
+        path, which can be read incrementally by a LogStreamReader
+        '''
+        from conspiracy.stream import LogStreamWriter
+        self.stream = LogStreamWriter(self, path, **kwargs)
+        return self.stream
+    
+    def flush_callbacks(self):
+        '''
+        waits until all asynchronous callbacks have caught up
+        '''
+        for log_callback in self.log_callbacks:
+            if hasattr(log_callback, 'flush'):
+                log_callback.flush()
+    
+    def close_callbacks(self):
+        '''
+        flushes and stops all asynchronous callbacks, and removes them from
+        log_callbacks so that the log can still be used afterwards
+        '''
+        remaining = []
+        for log_callback in self.log_callbacks:
+            if hasattr(log_callback, 'close'):
+                log_callback.close()
+            else:
+                remaining.append(log_callback)
+        self.log_callbacks[:] = remaining
     
     def get_contents(self):
         row = math.ceil(self.step / self.compression)
@@ -94,7 +688,19 @@ class Log:
     y = property(get_y)
     t = property(get_t)
     
-    def to_poly_line(self, x_coord, x_range=(0.,1.), approximation=False):
+    def to_poly_line(self,
+        x_coord,
+        x_range=(0.,1.),
+        approximation=False,
+        resolution=None,
+    ):
+        '''
+        x_coord       : 'step', 'time' or 'relative_time'
+        x_range       : the fraction of the log to return
+        approximation : if nonzero, averages the result down to this many rows
+        resolution    : the number of rows that will actually be visible
+                        (unused by single-resolution logs)
+        '''
         if x_coord == 'step':
             xy = self.contents[:,[1,0]]
         elif x_coord == 'time':
@@ -104,13 +710,999 @@ class Log:
             xy[:,0] -= xy[0,0]
         
         if approximation:
-            r = int(math.floor(xy.shape[0] / approximation))
-            clip_xy = xy[:r*approximation]
-            clip_xy = clip_xy.reshape(approximation, r, 2)
-            clip_xy = numpy.mean(clip_xy, axis=1)
-            xy = clip_xy
+            xy = approximate_poly_line(xy, approximation)
         
         n = xy.shape[0]
         start = round(x_range[0] * n)
         end = round(x_range[1] * n)
         return xy[start:end]
+    
+    def to_envelope_poly_line(self,
+        x_coord,
+        x_range=(0.,1.),
+        envelope='min_max',
+    ):
+        '''
+        returns a poly_line containing the mean, upper and lower envelope of
+        the log (see plot.envelope_poly_line), computed from the statistics
+        stored for each row
+        
+        envelope : 'min_max' for the minimum and maximum value of each row,
+                   'std' for the mean +/- one standard deviation
+        '''
+        if self.statistics is None:
+            raise ValueError('this log was not created with statistics=True')
+        
+        xy = self.to_poly_line(x_coord)
+        statistics = self.statistics[:xy.shape[0]]
+        if envelope == 'min_max':
+            lower = statistics[:,1]
+            upper = statistics[:,2]
+        elif envelope == 'std':
+            std = (statistics[:,3] / statistics[:,0])**0.5
+            lower = xy[:,1] - std
+            upper = xy[:,1] + std
+        else:
+            raise ValueError('"envelope" must be "min_max" or "std"')
+        
+        n = xy.shape[0]
+        start = round(x_range[0] * n)
+        end = round(x_range[1] * n)
+        return envelope_poly_line(
+            xy[start:end,0],
+            xy[start:end,1],
+            lower[start:end],
+            upper[start:end],
+        )
+    
+    def to_smoothed_poly_line(self,
+        x_coord,
+        x_range=(0.,1.),
+        smoothing='window',
+    ):
+        '''
+        returns a poly_line of the smoothed values stored for each row
+        
+        smoothing : 'window' for the rolling mean with an envelope of +/- one
+                    rolling standard deviation (see plot.envelope_poly_line),
+                    'ema' for the exponential moving average
+        '''
+        if self.smoother is None:
+            raise ValueError(
+                'this log was not created with smoothing_window or '
+                'smoothing_half_life')
+        
+        xy = self.to_poly_line(x_coord)
+        n = xy.shape[0]
+        start = round(x_range[0] * n)
+        end = round(x_range[1] * n)
+        smoothing_rows = self.smoothing[start:end]
+        if smoothing == 'window':
+            mean = smoothing_rows[:,0]
+            std = smoothing_rows[:,1]
+            return envelope_poly_line(
+                xy[start:end,0], mean, mean - std, mean + std)
+        elif smoothing == 'ema':
+            return numpy.stack((xy[start:end,0], smoothing_rows[:,2]), axis=1)
+        else:
+            raise ValueError('"smoothing" must be "window" or "ema"')
+
+def approximate_poly_line(xy, approximation):
+    r = int(math.floor(xy.shape[0] / approximation))
+    clip_xy = xy[:r*approximation]
+    clip_xy = clip_xy.reshape(approximation, r, 2)
+    clip_xy = numpy.mean(clip_xy, axis=1)
+    return clip_xy
+
+default_levels = 4
+class MipmapLog(Log):
+    '''
+    A fixed-capacity log that also keeps a pyramid of finer resolution levels
+    covering the most recent data.  Level k stores the most recent capacity
+    rows at a compression of 2**k, so level 0 holds the last capacity values at
+    full resolution.  The regular log data still covers the entire history at
+    the coarsest resolution, so memory is bounded by (levels+1)*capacity rows.
+    
+    to_poly_line picks the finest level that covers the requested x_range.
+    '''
+    def __init__(self,
+        capacity=default_capacity,
+        levels=default_levels,
+        state=None,
+        log_callbacks=None,
+    ):
+        if capacity == 'adaptive':
+            raise ValueError('MipmapLog requires a fixed capacity')
+        self.levels = numpy.zeros((levels, capacity, 3))
+        super().__init__(
+            capacity=capacity, state=state, log_callbacks=log_callbacks)
+    
+    def _state(self):
+        state = super()._state()
+        state['levels'] = self.levels
+        return state
+    
+    def set_state(self, state):
+        if is_binary_state(state):
+            state = decode_state(state)
+        super().set_state(state)
+        if 'levels' in state:
+            self.levels = numpy.array(state['levels'], dtype=float)
+    
+    def log(self, value):
+        item = [float(value), float(self.step), time.time()]
+        for k, level in enumerate(self.levels):
+            c = 2**k
+            slot = (self.step // c) % self.capacity
+            n = self.step % c
+            if n:
+                level[slot] = (level[slot] * n + item)/(n+1)
+            else:
+                level[slot] = item
+        
+        super().log(value)
+    
+    def log_many(self, values, timestamps=None):
+        values = numpy.asarray(values, dtype=float).reshape(-1)
+        if timestamps is None:
+            timestamps = numpy.full(values.shape[0], time.time())
+        first_step = self.step
+        super().log_many(values, timestamps=timestamps)
+        
+        if not values.shape[0]:
+            return
+        steps = numpy.arange(first_step, first_step + values.shape[0])
+        items = numpy.stack((values, steps.astype(float), timestamps), axis=1)
+        for k, level in enumerate(self.levels):
+            c = 2**k
+            rows = steps // c
+            
+            # only the most recent capacity rows survive in the ring
+            first_row = max(rows[0], rows[-1] - self.capacity + 1)
+            start = numpy.searchsorted(rows, first_row)
+            rows = rows[start:]
+            new_rows = numpy.unique(rows[rows * c >= first_step])
+            level[new_rows % self.capacity] = 0.
+            fold_items(
+                level,
+                rows % self.capacity,
+                items[start:],
+                (first_step + start) % c,
+                c,
+            )
+    
+    def get_level_rows(self, k):
+        '''
+        returns the range of rows that are currently stored in level k
+        '''
+        if not self.step:
+            return 0, 0
+        last_row = (self.step-1) // 2**k
+        return max(0, last_row - self.capacity + 1), last_row + 1
+    
+    def get_level_contents(self, k):
+        start, end = self.get_level_rows(k)
+        return self.levels[k][numpy.arange(start, end) % self.capacity]
+    
+    def to_poly_line(self,
+        x_coord,
+        x_range=(0.,1.),
+        approximation=False,
+        resolution=None,
+    ):
+        '''
+        x_coord       : 'step', 'time' or 'relative_time'
+        x_range       : the fraction of the logged steps to return
+        approximation : if nonzero, averages the result down to this many rows
+        resolution    : the number of rows that will actually be visible,
+                        if specified the coarsest level that still provides
+                        this many rows over x_range will be used instead of
+                        the finest one
+        '''
+        step_start = x_range[0] * self.step
+        step_end = x_range[1] * self.step
+        
+        # find every level that covers x_range, from finest to coarsest
+        candidates = []
+        for k in range(self.levels.shape[0]):
+            start, end = self.get_level_rows(k)
+            if start * 2**k <= step_start:
+                candidates.append((k, 2**k))
+        candidates.append((None, self.compression))
+        
+        k, c = candidates[0]
+        if resolution:
+            for candidate_k, candidate_c in candidates:
+                if (step_end - step_start) / candidate_c < resolution:
+                    break
+                k, c = candidate_k, candidate_c
+        
+        if k is None:
+            contents = self.contents
+            first_row = 0
+        else:
+            contents = self.get_level_contents(k)
+            first_row = self.get_level_rows(k)[0]
+        
+        if x_coord == 'step':
+            xy = contents[:,[1,0]]
+        elif x_coord == 'time':
+            xy = contents[:,[2,0]]
+        elif x_coord == 'relative_time':
+            xy = contents[:,[2,0]].copy()
+            xy[:,0] -= self.data[0,2]
+        
+        start = max(0, math.floor(step_start / c) - first_row)
+        end = max(0, math.ceil(step_end / c) - first_row)
+        xy = xy[start:end]
+        
+        if approximation:
+            xy = approximate_poly_line(xy, approximation)
+        
+        return xy
+
+memmap_magic = numpy.frombuffer(b'CNSPMMAP', dtype='<i8')[0]
+memmap_version = 1
+memmap_header_entries = 8
+memmap_header_bytes = memmap_header_entries * 8
+memmap_chunk_rows = 65536
+class MemmapLog(Log):
+    '''
+    An adaptive log that keeps its data in a memory-mapped file instead of in
+    RAM.  The file grows in chunks of chunk_rows rows, without copying the rows
+    that were already written.
+    
+    The file can be opened by another process with mode='r' while training
+    keeps appending to it.  The reader picks up new rows (and file growth)
+    every time its contents are accessed.
+    
+    file layout:
+    header : 8 little-endian int64 values
+             (magic, version, step, compression, rows, 0, 0, 0)
+    data   : rows x 3 little-endian float64 values (value, step, time)
+    '''
+    def __init__(self,
+        path,
+        mode='w+',
+        chunk_rows=memmap_chunk_rows,
+        log_callbacks=None,
+    ):
+        if mode not in ('w+', 'r+', 'r'):
+            raise ValueError('"mode" must be "w+", "r+" or "r"')
+        self.path = path
+        self.mode = mode
+        self.capacity = 'adaptive'
+        self.compression = 1
+        self.chunk_rows = chunk_rows
+        self.statistics = None
+        self._compress_buffer = None
+        
+        if mode == 'w+':
+            with open(path, 'wb') as f:
+                f.truncate(memmap_header_bytes + chunk_rows * 3 * 8)
+            self.header = numpy.memmap(
+                path,
+                dtype='<i8',
+                mode='r+',
+                shape=(memmap_header_entries,),
+            )
+            self.header[:] = 0
+            self.header[0] = memmap_magic
+            self.header[1] = memmap_version
+            self.header[3] = 1
+            self.header[4] = chunk_rows
+        else:
+            self.header = numpy.memmap(
+                path,
+                dtype='<i8',
+                mode=mode,
+                shape=(memmap_header_entries,),
+            )
+            if self.header[0] != memmap_magic:
+                raise ValueError('%s is not a conspiracy memmap log'%path)
+            if self.header[1] != memmap_version:
+                raise ValueError(
+                    'unsupported memmap log version: %i'%self.header[1])
+        
+        self._map_data()
+        
+        if log_callbacks is None:
+            log_callbacks = []
+        self.log_callbacks = log_callbacks
+    
+    def _map_data(self):
+        self.data = numpy.memmap(
+            self.path,
+            dtype='<f8',
+            mode=self.mode if self.mode != 'w+' else 'r+',
+            offset=memmap_header_bytes,
+            shape=(int(self.header[4]), 3),
+        )
+    
+    def get_step(self):
+        return int(self.header[2])
+    
+    def set_step(self, step):
+        self.header[2] = step
+    
+    step = property(get_step, set_step)
+    
+    def _state(self):
+        # only store the rows that were written, not the whole mapped file
+        state = super()._state()
+        state['data'] = numpy.array(self.contents)
+        return state
+    
+    def set_state(self, state):
+        if is_binary_state(state):
+            state = decode_state(state)
+        if state['capacity'] != 'adaptive' or state['compression'] != 1:
+            raise ValueError('MemmapLog can only store adaptive logs')
+        data = numpy.array(state['data'])
+        self.step = 0
+        self.grow(data.shape[0])
+        self.data[:data.shape[0]] = data
+        self.step = state['step']
+    
+    def grow(self, rows):
+        '''
+        extends the file (in chunks) so that it can hold at least rows entries
+        '''
+        chunks = -(-rows // self.chunk_rows)
+        rows = chunks * self.chunk_rows
+        self.data.flush()
+        os.truncate(self.path, memmap_header_bytes + rows * 3 * 8)
+        self.header[4] = rows
+        self._map_data()
+    
+    def get_contents(self):
+        if self.header[4] != self.data.shape[0]:
+            # another process has grown the file
+            self._map_data()
+        return super().get_contents()
+    
+    contents = property(get_contents)
+    
+    def flush(self):
+        self.data.flush()
+        self.header.flush()
+
+class LockedLog(Log):
+    '''
+    A Log that can be updated from multiple threads at once.  Every update
+    holds a lock, and contents/get_state return consistent snapshots.
+    '''
+    def __init__(self, *args, **kwargs):
+        self.lock = threading.Lock()
+        super().__init__(*args, **kwargs)
+    
+    def get_state(self, binary=False):
+        with self.lock:
+            return super().get_state(binary=binary)
+    
+    def set_state(self, state):
+        with self.lock:
+            super().set_state(state)
+    
+    def log(self, value):
+        with self.lock:
+            super().log(value)
+    
+    def log_many(self, values, timestamps=None):
+        with self.lock:
+            super().log_many(values, timestamps=timestamps)
+    
+    def get_contents(self):
+        with self.lock:
+            return super().get_contents().copy()
+    
+    contents = property(get_contents)
+
+shared_header_entries = 4
+shared_header_bytes = shared_header_entries * 8
+class SharedLog(Log):
+    '''
+    A fixed-capacity Log stored in a multiprocessing.shared_memory block, so
+    that many processes can append to the same log.  Updates are serialized
+    with a multiprocessing lock, and contents/get_state return consistent
+    snapshots.
+    
+    The log can be passed to other processes as an argument to
+    multiprocessing.Process (or pickled while spawning them), or attached to
+    by name with SharedLog(capacity, name=name, lock=lock).  The process that
+    created the log should call unlink when it is no longer needed.
+    
+    memory layout:
+    header : 4 int64 values (step, compression, capacity, 0)
+    data   : capacity x 3 float64 values (value, step, time)
+    '''
+    def __init__(self,
+        capacity=default_capacity,
+        name=None,
+        lock=None,
+        state=None,
+        log_callbacks=None,
+    ):
+        import multiprocessing
+        from multiprocessing import shared_memory
+        
+        if capacity == 'adaptive':
+            raise ValueError('SharedLog requires a fixed capacity')
+        self.capacity = capacity
+        if lock is None:
+            lock = multiprocessing.Lock()
+        self.lock = lock
+        self.statistics = None
+        
+        size = shared_header_bytes + capacity * 3 * 8
+        if name is None:
+            self.shared_memory = shared_memory.SharedMemory(
+                create=True, size=size)
+        else:
+            self.shared_memory = attach_shared_memory(name)
+        self._map_buffer()
+        if name is None:
+            self.header[:] = (0, 1, capacity, 0)
+            self.data[:] = 0.
+        self._allocate_compress_buffer()
+        
+        if state is not None:
+            self.set_state(state)
+        
+        if log_callbacks is None:
+            log_callbacks = []
+        self.log_callbacks = log_callbacks
+    
+    def _map_buffer(self):
+        self.header = numpy.ndarray(
+            (shared_header_entries,),
+            dtype=numpy.int64,
+            buffer=self.shared_memory.buf,
+        )
+        self.data = numpy.ndarray(
+            (self.capacity, 3),
+            dtype=numpy.float64,
+            buffer=self.shared_memory.buf,
+            offset=shared_header_bytes,
+        )
+    
+    @property
+    def name(self):
+        return self.shared_memory.name
+    
+    def __getstate__(self):
+        return {
+            'capacity' : self.capacity,
+            'name' : self.name,
+            'lock' : self.lock,
+        }
+    
+    def __setstate__(self, state):
+        self.__init__(
+            state['capacity'], name=state['name'], lock=state['lock'])
+    
+    def get_step(self):
+        return int(self.header[0])
+    
+    def set_step(self, step):
+        self.header[0] = step
+    
+    step = property(get_step, set_step)
+    
+    def get_compression(self):
+        return int(self.header[1])
+    
+    def set_compression(self, compression):
+        self.header[1] = compression
+    
+    compression = property(get_compression, set_compression)
+    
+    def get_state(self, binary=False):
+        with self.lock:
+            return super().get_state(binary=binary)
+    
+    def set_state(self, state):
+        if is_binary_state(state):
+            state = decode_state(state)
+        if state['capacity'] != self.capacity:
+            raise ValueError('SharedLog capacity does not match the state')
+        with self.lock:
+            self.data[:] = state['data']
+            self.step = state['step']
+            self.compression = state['compression']
+            self._folded_pairs = 0
+    
+    def log(self, value):
+        with self.lock:
+            super().log(value)
+    
+    def log_many(self, values, timestamps=None):
+        with self.lock:
+            super().log_many(values, timestamps=timestamps)
+    
+    def get_contents(self):
+        with self.lock:
+            return super().get_contents().copy()
+    
+    contents = property(get_contents)
+    
+    def close(self):
+        del self.header
+        del self.data
+        self.shared_memory.close()
+    
+    def unlink(self):
+        self.close()
+        self.shared_memory.unlink()
+
+def attach_shared_memory(name):
+    '''
+    attaches to an existing shared memory block without letting the resource
+    tracker destroy it when this process exits
+    '''
+    from multiprocessing import shared_memory, resource_tracker
+    
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        pass
+    
+    # children started by multiprocessing share the resource tracker of their
+    # parent, any other process starts its own tracker when attaching
+    shared_tracker = resource_tracker._resource_tracker._fd is not None
+    block = shared_memory.SharedMemory(name=name)
+    if not shared_tracker:
+        resource_tracker.unregister(block._name, 'shared_memory')
+    return block
+
+class FastLog:
+    '''
+    A low-overhead alternative to Log for the training loop.  Instead of
+    updating a numpy row on every call, the current row is accumulated in
+    python scalars and only written into data when the row closes.  Its
+    state is compatible with Log.get_state/set_state.
+    
+    timestamps : when to record wall-clock time,
+                 'value' averages the time of every value (like Log),
+                 'row' records the time at which each row is written,
+                 None does not record time at all (the time column is zero)
+    '''
+    __slots__ = (
+        'capacity',
+        'step',
+        'compression',
+        'data',
+        'statistics',
+        'smoother',
+        'smoothing',
+        'timestamps',
+        'log_callbacks',
+        '_compress_buffer',
+        '_compress_statistics',
+        '_compress_smoothing',
+        '_folded_pairs',
+        '_folded_compression',
+        '_row_count',
+        '_value_sum',
+        '_time_sum',
+        'stream',
+    )
+    
+    def __init__(self,
+        capacity=default_capacity,
+        state=None,
+        log_callbacks=None,
+        timestamps='value',
+    ):
+        if timestamps not in ('value', 'row', None):
+            raise ValueError('"timestamps" must be "value", "row" or None')
+        self.capacity = capacity
+        self.step = 0
+        if capacity == 'adaptive':
+            c = 1
+        else:
+            c = capacity
+        self.data = numpy.zeros((c, 3))
+        self.compression = 1
+        self.statistics = None
+        self.smoother = None
+        self.smoothing = None
+        self.stream = None
+        self.timestamps = timestamps
+        self._allocate_compress_buffer()
+        self._reset_row()
+        
+        if state is not None:
+            self.set_state(state)
+        
+        if log_callbacks is None:
+            log_callbacks = []
+        self.log_callbacks = log_callbacks
+    
+    def get_state(self, binary=False):
+        self._write_row()
+        return Log.get_state(self, binary=binary)
+    
+    def set_state(self, state):
+        Log.set_state(self, state)
+        self.statistics = None
+        self.smoother = None
+        self.smoothing = None
+        self._read_row()
+    
+    def log(self, value):
+        if type(value) is not float:
+            value = float(value)
+        step = self.step
+        if not self._row_count and step // self.compression >= len(self.data):
+            if self.capacity == 'adaptive':
+                self.grow(step + 1)
+            else:
+                self.compress()
+        
+        self._value_sum += value
+        if self.timestamps == 'value':
+            self._time_sum += time.time()
+        self._row_count += 1
+        self.step = step + 1
+        
+        for log_callback in self.log_callbacks:
+            log_callback(value, step)
+        
+        if self._row_count == self.compression:
+            self._write_row()
+            self._reset_row()
+            row = step // self.compression
+            if self.stream is not None:
+                self.stream.write_rows(row, row+1)
+            if row % 2:
+                self._fold_pairs()
+    
+    def log_many(self, values, timestamps=None):
+        self._write_row()
+        if timestamps is None and self.timestamps is None:
+            timestamps = numpy.zeros(numpy.size(values))
+        Log.log_many(self, values, timestamps=timestamps)
+        self._read_row()
+    
+    def _reset_row(self):
+        self._row_count = 0
+        self._value_sum = 0.
+        self._time_sum = 0.
+    
+    def _write_row(self):
+        '''
+        writes the running averages of the current row into data
+        '''
+        n = self._row_count
+        if not n:
+            return
+        row = (self.step - 1) // self.compression
+        first_step = self.step - n
+        if self.timestamps == 'value':
+            t = self._time_sum / n
+        elif self.timestamps == 'row':
+            t = time.time()
+        else:
+            t = 0.
+        self.data[row] = (self._value_sum / n, first_step + (n-1) / 2, t)
+    
+    def _read_row(self):
+        '''
+        recovers the running sums of the current row from data
+        '''
+        self._reset_row()
+        n = self.step % self.compression
+        if n:
+            row = self.step // self.compression
+            self._row_count = n
+            self._value_sum = self.data[row,0] * n
+            self._time_sum = self.data[row,2] * n
+    
+    _fold = Log._fold
+    stream_to = Log.stream_to
+    grow = Log.grow
+    compress = Log.compress
+    _allocate_compress_buffer = Log._allocate_compress_buffer
+    _fold_pairs = Log._fold_pairs
+    add_log_callback = Log.add_log_callback
+    add_async_log_callback = Log.add_async_log_callback
+    add_tensorboard_log_callback = Log.add_tensorboard_log_callback
+    flush_callbacks = Log.flush_callbacks
+    close_callbacks = Log.close_callbacks
+    _state = Log._state
+    
+    def get_contents(self):
+        self._write_row()
+        return Log.get_contents(self)
+    
+    contents = property(get_contents)
+    x = property(Log.get_x)
+    y = property(Log.get_y)
+    t = property(Log.get_t)
+    to_poly_line = Log.to_poly_line
+    to_envelope_poly_line = Log.to_envelope_poly_line
+    to_smoothed_poly_line = Log.to_smoothed_poly_line
+
+default_histogram_bins = 32
+default_histogram_capacity = 64
+class HistogramLog:
+    '''
+    Tracks the distribution of a stream of values in bounded memory.  Values
+    are counted into a fixed number of bins, and the counts are stored in
+    rows of snapshots, where each row covers a window of steps.  Like Log,
+    once all rows are full, neighboring rows are added together and each row
+    covers twice as many steps as before.
+    
+    bins        : the number of bins
+    value_range : the (low, high) range of the bins, values outside of it are
+                  counted in the first or last bin.  If None, the bins adapt
+                  to the values: their width is a power of two and doubles
+                  (merging neighboring bins) whenever the observed range of
+                  values no longer fits, so histograms with the same number
+                  of bins can always be added together after rebinning
+    capacity    : the number of rows to store before compressing, or
+                  'adaptive' to grow forever
+    state       : a state generated by get_state to restore
+    '''
+    def __init__(self,
+        bins=default_histogram_bins,
+        value_range=None,
+        capacity=default_histogram_capacity,
+        state=None,
+    ):
+        if value_range is None and bins % 2:
+            raise ValueError('adaptive histograms need an even number of bins')
+        self.bins = bins
+        self.value_range = value_range
+        self.capacity = capacity
+        self.step = 0
+        self.compression = 1
+        if capacity == 'adaptive':
+            c = 1
+        else:
+            c = capacity
+        self.counts = numpy.zeros((c, bins), dtype=numpy.int64)
+        self.minimum = None
+        self.maximum = None
+        if value_range is None:
+            self.low = None
+            self.width = None
+        else:
+            self.low = float(value_range[0])
+            self.width = (value_range[1] - value_range[0]) / bins
+        
+        if state is not None:
+            self.set_state(state)
+    
+    def get_state(self, binary=False):
+        '''
+        binary : if True, the state is encoded as a compact bytes object using
+                 encode_state instead of a dictionary of python lists
+        '''
+        return finalize_state({
+            'bins' : self.bins,
+            'value_range' : self.value_range,
+            'capacity' : self.capacity,
+            'step' : self.step,
+            'compression' : self.compression,
+            'low' : self.low,
+            'width' : self.width,
+            'minimum' : self.minimum,
+            'maximum' : self.maximum,
+            'counts' : self.counts,
+        }, binary)
+    
+    def set_state(self, state):
+        if is_binary_state(state):
+            state = decode_state(state)
+        self.bins = state['bins']
+        self.value_range = state['value_range']
+        self.capacity = state['capacity']
+        self.step = state['step']
+        self.compression = state['compression']
+        self.low = state['low']
+        self.width = state['width']
+        self.counts = numpy.array(
+            state['counts'], dtype=numpy.int64).reshape(-1, self.bins)
+        
+        # older states did not record the observed range, the occupied bins
+        # are the tightest range known to contain every counted value
+        if 'minimum' in state:
+            self.minimum = state['minimum']
+            self.maximum = state['maximum']
+        elif self.width is not None and self.value_range is None:
+            occupied = numpy.flatnonzero(self.counts.sum(axis=0))
+            if len(occupied):
+                first, last = occupied[0], occupied[-1] + 1
+            else:
+                first, last = 0, 1
+            self.minimum = self.low + self.width * first
+            self.maximum = float(numpy.nextafter(
+                self.low + self.width * last, -numpy.inf))
+        else:
+            self.minimum = None
+            self.maximum = None
+    
+    def get_edges(self):
+        '''
+        returns the bins+1 edges of the bins
+        '''
+        if self.width is None:
+            return numpy.zeros(self.bins+1)
+        return self.low + self.width * numpy.arange(self.bins+1)
+    
+    def _fit(self):
+        '''
+        fits the adaptive bins to the observed range of values: the width
+        becomes the smallest power of two (no smaller than the current width)
+        whose aligned bins cover minimum and maximum, so the bins only depend
+        on the range of the values, not on the order they were logged in
+        '''
+        low, high = self.minimum, self.maximum
+        width = self.width
+        if width is None:
+            # start from the finest width that can represent the first values
+            width = 2.**(math.frexp(max(abs(low), abs(high)))[1] - 53)
+        if high > low:
+            width = max(width, 2.**math.ceil(math.log2((high-low) / self.bins)))
+        new_low = math.floor(low / width) * width
+        while high >= new_low + width * self.bins:
+            width *= 2
+            new_low = math.floor(low / width) * width
+        
+        if self.width is not None and (
+            width != self.width or new_low != self.low
+        ):
+            # every old bin falls entirely inside one of the new bins, and
+            # old bins outside of the observed range are empty
+            factor = round(width / self.width)
+            offset = round((self.low - new_low) / self.width)
+            new_bins = (offset + numpy.arange(self.bins)) // factor
+            inside = new_bins < self.bins
+            counts = numpy.zeros_like(self.counts)
+            numpy.add.at(counts.T, new_bins[inside], self.counts.T[inside])
+            self.counts = counts
+        
+        self.low = new_low
+        self.width = width
+    
+    def _bin(self, values):
+        bins = numpy.floor((values - self.low) / self.width)
+        return numpy.clip(bins, 0, self.bins-1).astype(numpy.int64)
+    
+    def log(self, value):
+        value = float(value)
+        row = self.step // self.compression
+        if row >= self.counts.shape[0]:
+            if self.capacity == 'adaptive':
+                self.grow(row + 1)
+            else:
+                self.compress()
+                row = self.step // self.compression
+        
+        if math.isfinite(value):
+            if self.value_range is None:
+                if self.width is None:
+                    self.minimum = self.maximum = value
+                    self._fit()
+                elif value < self.minimum or value > self.maximum:
+                    self.minimum = min(self.minimum, value)
+                    self.maximum = max(self.maximum, value)
+                    if (
+                        value < self.low or
+                        value >= self.low + self.width * self.bins
+                    ):
+                        self._fit()
+            b = math.floor((value - self.low) / self.width)
+            self.counts[row, min(max(b, 0), self.bins-1)] += 1
+        
+        self.step += 1
+    
+    def log_many(self, values):
+        '''
+        counts an entire array of values in one vectorized pass, non-finite
+        values take up a step but are not counted in any bin
+        '''
+        values = numpy.asarray(values, dtype=float).reshape(-1)
+        finite = numpy.isfinite(values)
+        if self.value_range is None and finite.any():
+            low = float(values[finite].min())
+            high = float(values[finite].max())
+            if self.width is None:
+                self.minimum, self.maximum = low, high
+            else:
+                self.minimum = min(self.minimum, low)
+                self.maximum = max(self.maximum, high)
+            if (
+                self.width is None or
+                self.minimum < self.low or
+                self.maximum >= self.low + self.width * self.bins
+            ):
+                self._fit()
+        bins = numpy.full(values.shape, -1, dtype=numpy.int64)
+        if self.width is not None:
+            bins[finite] = self._bin(values[finite])
+        
+        start = 0
+        while start < len(values):
+            row = self.step // self.compression
+            if row >= self.counts.shape[0]:
+                if self.capacity == 'adaptive':
+                    self.grow(row + 1)
+                else:
+                    self.compress()
+                continue
+            
+            end = min(
+                len(values),
+                start + self.counts.shape[0] * self.compression - self.step,
+            )
+            rows = (self.step + numpy.arange(end - start)) // self.compression
+            segment = bins[start:end]
+            counted = segment >= 0
+            self.counts += numpy.bincount(
+                rows[counted] * self.bins + segment[counted],
+                minlength=self.counts.size,
+            ).reshape(self.counts.shape)
+            self.step += end - start
+            start = end
+    
+    def grow(self, rows):
+        '''
+        extends an adaptive histogram so that it can hold at least rows
+        snapshots by repeatedly doubling its size
+        '''
+        new_rows = self.counts.shape[0]
+        while new_rows < rows:
+            new_rows *= 2
+        counts = numpy.zeros((new_rows, self.bins), dtype=numpy.int64)
+        counts[:self.counts.shape[0]] = self.counts
+        self.counts = counts
+    
+    def compress(self):
+        half = self.counts[0::2] + self.counts[1::2]
+        self.counts[:len(half)] = half
+        self.counts[len(half):] = 0
+        self.compression *= 2
+    
+    def get_counts(self, x_range=(0., 1.)):
+        '''
+        returns the number of values in each bin, counting only the rows that
+        fall in x_range, a fraction of all of the steps logged so far
+        '''
+        rows = -(-self.step // self.compression)
+        start = round(x_range[0] * rows)
+        end = max(round(x_range[1] * rows), start + 1)
+        return self.counts[start:end].sum(axis=0)
+    
+    def to_histogram(self, x_range=(0., 1.), trim=True):
+        '''
+        returns a dictionary of {(low, high) : count} that can be passed to
+        plot_histogram with format_string='%.02f-%.02f:'
+        
+        trim : if True, leaves out the empty bins at either end
+        '''
+        counts = self.get_counts(x_range)
+        edges = self.get_edges()
+        start, end = 0, self.bins
+        if trim:
+            nonzero = numpy.flatnonzero(counts)
+            if len(nonzero):
+                start, end = nonzero[0], nonzero[-1]+1
+        return {
+            (float(edges[i]), float(edges[i+1])) : int(counts[i])
+            for i in range(start, end)
+        }
+    
+    def quantile(self, q, x_range=(0., 1.)):
+        '''
+        estimates the q quantiles (between 0 and 1) of the values in x_range
+        by interpolating linearly within each bin
+        '''
+        counts = self.get_counts(x_range)
+        total = counts.sum()
+        if not total:
+            return numpy.full(numpy.shape(q), numpy.nan)
+        cumulative = numpy.concatenate(([0], numpy.cumsum(counts))) / total
+        return numpy.interp(q, cumulative, self.get_edges())
@@ -0,0 +1,242 @@
+import math
+import time
+
+import numpy
+
+from conspiracy.log import (
+    Log, default_capacity, fold_items, finalize_state, is_binary_state,
+    decode_state,
+)
+
+class LogBook:
+    '''
+    Stores many metrics that are logged in lockstep in a single columnar
+    array with one shared step and time column.  A whole row of metrics is
+    logged in one call, and all metrics are compressed together.
+    
+    data columns: step, time, metric_0, metric_1, ...
+    
+    Each metric can be accessed as a Log-compatible view using logbook[name],
+    which can be passed directly to plot_logs and plot_logs_grid.
+    
+    example:
+    logbook = LogBook(['loss', 'accuracy'])
+    logbook.log(loss=0.5, accuracy=0.9)
+    plot_logs(logbook.logs())
+    '''
+    def __init__(self,
+        names=(),
+        capacity=default_capacity,
+        state=None,
+    ):
+        self.names = list(names)
+        self.columns = {name:i+2 for i, name in enumerate(self.names)}
+        self.capacity = capacity
+        self.step = 0
+        if capacity == 'adaptive':
+            c = 1
+        else:
+            c = capacity
+        self.data = numpy.zeros((c, len(self.names)+2))
+        self.compression = 1
+        self._allocate_compress_buffer()
+        self._views = {}
+        
+        if state is not None:
+            self.set_state(state)
+    
+    def get_state(self, binary=False):
+        return finalize_state({
+            'names' : self.names,
+            'capacity' : self.capacity,
+            'step' : self.step,
+            'data' : self.data,
+            'compression' : self.compression,
+        }, binary)
+    
+    def set_state(self, state):
+        if is_binary_state(state):
+            state = decode_state(state)
+        self.names = list(state['names'])
+        self.columns = {name:i+2 for i, name in enumerate(self.names)}
+        self.capacity = state['capacity']
+        self.step = state['step']
+        self.data = numpy.array(state['data'], dtype=float)
+        self.compression = state['compression']
+        self._allocate_compress_buffer()
+        self._views = {}
+    
+    def _make_row(self, values, kwargs):
+        if values is None:
+            values = kwargs
+        if isinstance(values, dict):
+            if set(values) != set(self.names):
+                missing = sorted(set(self.names) - set(values))
+                unknown = sorted(set(values) - set(self.names))
+                raise ValueError(
+                    'missing values for: %s, unknown names: %s'%(
+                        missing, unknown))
+            values = [values[name] for name in self.names]
+        return [float(value) for value in values]
+    
+    def log(self, values=None, **kwargs):
+        '''
+        logs one value for every metric, either as a dictionary, as keyword
+        arguments or as a sequence in the same order as names
+        '''
+        values = self._make_row(values, kwargs)
+        row = self.step // self.compression
+        if row >= self.data.shape[0]:
+            if self.capacity == 'adaptive':
+                self.grow(row + 1)
+            else:
+                self.compress()
+                row = self.step // self.compression
+        n = self.step % self.compression
+        item = [float(self.step), time.time()] + values
+        self.data[row] = (self.data[row] * n + item)/(n+1)
+        self.step += 1
+    
+    def log_many(self, values, timestamps=None):
+        '''
+        logs many rows at once
+        
+        values     : an array with one row per step and one column per metric
+                     (in the same order as names), or a dictionary of arrays
+        timestamps : an array of timestamps, one per row
+        '''
+        if isinstance(values, dict):
+            values = numpy.stack(
+                [numpy.asarray(values[name], dtype=float)
+                for name in self.names], axis=1)
+        values = numpy.asarray(values, dtype=float).reshape(
+            -1, len(self.names))
+        m = values.shape[0]
+        if timestamps is None:
+            timestamps = numpy.full(m, time.time())
+        else:
+            timestamps = numpy.asarray(timestamps, dtype=float).reshape(-1)
+            if timestamps.shape[0] != m:
+                raise ValueError(
+                    'timestamps must have the same length as values')
+        
+        start = 0
+        while start < m:
+            if self.capacity == 'adaptive':
+                rows = self.step + m - start
+                if rows > self.data.shape[0]:
+                    self.grow(rows)
+            elif self.step // self.compression >= self.data.shape[0]:
+                self.compress()
+            
+            end = self.data.shape[0] * self.compression - self.step
+            end = min(m, start + end)
+            c = self.compression
+            steps = numpy.arange(self.step, self.step + end - start)
+            items = numpy.concatenate((
+                steps[:,None].astype(float),
+                timestamps[start:end,None],
+                values[start:end],
+            ), axis=1)
+            fold_items(self.data, steps // c, items, self.step % c, c)
+            self.step += end - start
+            start = end
+    
+    def grow(self, rows):
+        new_rows = self.data.shape[0]
+        while new_rows < rows:
+            new_rows *= 2
+        data = numpy.zeros((new_rows, self.data.shape[1]))
+        data[:self.data.shape[0]] = self.data
+        self.data = data
+    
+    def _allocate_compress_buffer(self):
+        if self.capacity == 'adaptive':
+            self._compress_buffer = None
+        else:
+            self._compress_buffer = numpy.zeros(
+                (self.data.shape[0]//2, self.data.shape[1]))
+    
+    def compress(self):
+        self.compression = self.compression * 2
+        half = self._compress_buffer
+        numpy.add(self.data[0::2], self.data[1::2], out=half)
+        numpy.divide(half, 2., out=half)
+        self.data[:half.shape[0]] = half
+        self.data[half.shape[0]:] = 0.
+    
+    def get_contents(self):
+        row = math.ceil(self.step / self.compression)
+        return self.data[:row]
+    
+    contents = property(get_contents)
+    
+    def __getitem__(self, name):
+        # reuse one view per metric, so that a RenderCache recognizes the
+        # logs it drew on the previous frame
+        if name not in self._views:
+            self._views[name] = LogBookView(self, name)
+        return self._views[name]
+    
+    def __contains__(self, name):
+        return name in self.columns
+    
+    def logs(self, names=None):
+        '''
+        returns a dictionary of {name:view} pairs for plot_logs
+        '''
+        if names is None:
+            names = self.names
+        return {name:self[name] for name in names}
+
+class LogBookView:
+    '''
+    A read-only Log-compatible view of a single metric in a LogBook.
+    '''
+    # a LogBook does not track per-row statistics or smoothing, so envelope
+    # and smoothing plots raise the same ValueError as a plain Log
+    statistics = None
+    smoother = None
+    smoothing = None
+    
+    def __init__(self, logbook, name):
+        if name not in logbook.columns:
+            raise KeyError(name)
+        self.logbook = logbook
+        self.name = name
+    
+    @property
+    def capacity(self):
+        return self.logbook.capacity
+    
+    @property
+    def step(self):
+        return self.logbook.step
+    
+    @property
+    def compression(self):
+        return self.logbook.compression
+    
+    @property
+    def data(self):
+        return self.logbook.data[:,[self.logbook.columns[self.name], 0, 1]]
+    
+    def get_state(self, binary=False):
+        return finalize_state({
+            'capacity' : self.capacity,
+            'step' : self.step,
+            'data' : self.data,
+            'compression' : self.compression,
+        }, binary)
+    
+    def get_contents(self):
+        contents = self.logbook.contents
+        return contents[:,[self.logbook.columns[self.name], 0, 1]]
+    
+    contents = property(get_contents)
+    x = property(Log.get_x)
+    y = property(Log.get_y)
+    t = property(Log.get_t)
+    to_poly_line = Log.to_poly_line
+    to_envelope_poly_line = Log.to_envelope_poly_line
+    to_smoothed_poly_line = Log.to_smoothed_poly_line
@@ -1,10 +1,7 @@
 import math
-from colorama import Fore, Back, Style
 
 import numpy
 
-from scipy.ndimage import uniform_filter1d
-
 '''
 This is a simple library for making plots that can be printed to a terminal.  It
 works "drawing" "pixels" made up of braille characters.  The basic structures
@@ -37,6 +34,9 @@ color_name_to_index = {
 color_index_to_name = {i:n for n,i in color_name_to_index.items()}
 color_index_to_name[0] = 'WHITE'
 
+# the same as colorama.Style.RESET_ALL, colorama is only imported when needed
+reset_all = '\033[0m'
+
 # box drawing characters =======================================================
 hh = chr(0x2500 + 0x0)
 vv = chr(0x2500 + 0x2)
@@ -68,6 +68,77 @@ def chunk_to_braille(chunk):
     char = chr(0x2800 + braille_id)
     return char
 
+braille_weights = numpy.array([
+    [1, 8],
+    [2, 16],
+    [4, 32],
+    [64, 128],
+])
+braille_table = numpy.array([chr(0x2800 + i) for i in range(256)])
+
+def int_image_to_braille(int_image):
+    '''
+    converts an int_image into two arrays with one entry per braille
+    character: the braille character and the largest (color) value in the
+    corresponding 4x2 block of pixels
+    '''
+    h = int_image.shape[0]
+    w = int_image.shape[1]
+    out_h = math.ceil(h / 4)
+    out_w = math.ceil(w / 2)
+    if h != out_h * 4 or w != out_w * 2:
+        padded_image = numpy.zeros((out_h*4, out_w*2), dtype=int_image.dtype)
+        padded_image[:h,:w] = int_image
+        int_image = padded_image
+    
+    blocks = int_image.reshape(out_h, 4, out_w, 2)
+    braille_ids = numpy.einsum(
+        'iajb,ab->ij', (blocks != 0).astype(int), braille_weights)
+    chars = braille_table[braille_ids]
+    colors = blocks.max(axis=(1,3))
+    return chars, colors
+
+color_index_to_code = None
+def get_color_index_to_code():
+    '''
+    returns an array of the colorama code for each color index, colorama is
+    only imported the first time this is needed
+    '''
+    global color_index_to_code
+    if color_index_to_code is None:
+        from colorama import Fore
+        color_index_to_code = numpy.array([
+            getattr(Fore, color_index_to_name[i])
+            for i in range(max(color_index_to_name)+1)
+        ])
+    return color_index_to_code
+
+def braille_to_text_cells(chars, colors=None, breaks=()):
+    '''
+    prefixes each character from int_image_to_braille with a color code
+    wherever the color changes along a line, and at the start of each line
+    
+    breaks : additional columns that should always start with a color code
+    '''
+    if colors is None:
+        return chars
+    
+    starts = numpy.ones(colors.shape, dtype=bool)
+    starts[:,1:] = colors[:,1:] != colors[:,:-1]
+    starts[:,list(breaks)] = True
+    prefixes = numpy.where(
+        starts, get_color_index_to_code()[colors.astype(int)], '')
+    return numpy.char.add(prefixes, chars)
+
+def braille_to_text_lines(chars, colors=None):
+    '''
+    joins the output of int_image_to_braille into lines of text, inserting a
+    color code only where the color changes along a line
+    '''
+    cells = braille_to_text_cells(chars, colors)
+    reset = reset_all if colors is not None else ''
+    return [''.join(row) + reset for row in cells.tolist()]
+
 def int_image_to_text_image(
     int_image,
     #colors = None
@@ -82,32 +153,14 @@ def int_image_to_text_image(
     int_image        : a 2 dimensional integer array
     background_color : the background color of the entire image
     '''
-    h = int_image.shape[0]
-    w = int_image.shape[1]
-    out_h = math.ceil(h / 4)
-    out_w = math.ceil(w / 2)
-    
-    lines = []
-    for i in range(out_h):
-        line = []
-        for j in range(out_w):
-            chunk = int_image[i*4:(i+1)*4, j*2:(j+1)*2]
-            char = chunk_to_braille(chunk)
-            if use_colors:
-                max_id = numpy.max(chunk)
-                #color_name = color_palette[max_id]
-                color_name = color_index_to_name[max_id]
-                char = getattr(Fore, color_name) + char
-            line.append(char)
-        line = ''.join(line)
-        if use_colors:
-            line = line + Style.RESET_ALL
-        lines.append(line)
+    chars, colors = int_image_to_braille(int_image)
+    lines = braille_to_text_lines(chars, colors if use_colors else None)
     lines = '\n'.join(lines)
     
     text = lines
     if use_colors and background_color is not None:
-        text = getattr(Back, background) + lines
+        from colorama import Back
+        text = getattr(Back, background_color) + lines
     
     return lines
 
@@ -163,6 +216,113 @@ def rasterize_line_segment(int_image, line_segment, color):
                     break
                 int_image[y,x] = color_name_to_index[color]
 
+def line_segment_pixels(line_segments, shape):
+    '''
+    computes the pixels covered by many 2d line segments at once, matching
+    rasterize_line_segment pixel for pixel
+    
+    line_segments : an array of line segments in (x0, y0, x1, y1) format
+    shape         : the (height, width) of the image the segments are drawn on
+    
+    returns the y and x coordinates of each pixel inside the image, and the
+    index of the line segment that drew it
+    '''
+    h, w = shape[:2]
+    line_segments = numpy.asarray(line_segments, dtype=float).reshape(-1, 4)
+    x0, y0, x1, y1 = line_segments.T
+    
+    # a is the major axis that advances one pixel at a time, b is the minor
+    x_major = numpy.abs(x1 - x0) > numpy.abs(y1 - y0)
+    a0 = numpy.where(x_major, x0, y0)
+    a1 = numpy.where(x_major, x1, y1)
+    b0 = numpy.where(x_major, y0, x0)
+    b1 = numpy.where(x_major, y1, x1)
+    flip = a1 < a0
+    a0, a1 = numpy.where(flip, a1, a0), numpy.where(flip, a0, a1)
+    b0, b1 = numpy.where(flip, b1, b0), numpy.where(flip, b0, b1)
+    db = b1 - b0
+    
+    a0r = numpy.round(a0).astype(int)
+    a1r = numpy.round(a1).astype(int)
+    steps = a1r - a0r
+    
+    # only generate the steps that land inside the image along the major axis
+    a_limit = numpy.where(x_major, w, h)
+    first = numpy.maximum(-a0r, 0)
+    last = numpy.minimum(steps, a_limit - 1 - a0r)
+    counts = numpy.where((steps > 0) & (last >= first), last - first + 1, 0)
+    
+    segment = numpy.repeat(numpy.arange(len(line_segments)), counts)
+    offsets = numpy.cumsum(counts) - counts
+    step = numpy.arange(segment.shape[0]) - offsets[segment] + first[segment]
+    t = step / steps[segment]
+    a = a0r[segment] + step
+    b = numpy.round(b0[segment] + t * db[segment]).astype(int)
+    
+    xs = numpy.where(x_major[segment], a, b)
+    ys = numpy.where(x_major[segment], b, a)
+    inside = (xs >= 0) & (xs < w) & (ys >= 0) & (ys < h)
+    
+    return ys[inside], xs[inside], segment[inside]
+
+def poly_line_segments(poly_line):
+    '''
+    converts a poly_line into an array of line segments in (x0, y0, x1, y1)
+    format, skipping segments that end on a point whose third column is zero
+    '''
+    poly_line = numpy.asarray(poly_line)
+    segments = numpy.concatenate(
+        (poly_line[:-1,:2], poly_line[1:,:2]), axis=1)
+    if poly_line.shape[1] > 2:
+        segments = segments[poly_line[1:,2] != 0]
+    return segments
+
+def column_spans(line_segments, shape):
+    '''
+    splits line segments (in pixel coordinates) into the ones that need to be
+    rasterized and the ones that stay inside a single pixel column, which
+    only ever draw a vertical span of pixels in that column.  this is M4
+    style decimation: however many points fall in a column, all that is left
+    of them is the segments entering and leaving the column (its first and
+    last point) and the spans between its min and max, so drawing costs
+    O(width) instead of O(points)
+    
+    line_segments : an array of line segments in (x0, y0, x1, y1) format
+    shape         : the (height, width) of the image the segments are drawn on
+    
+    returns a boolean mask of the segments that must still be rasterized, the
+    indices of the segments that draw spans, and the column, first row and
+    last row of each span, matching rasterize_line_segment pixel for pixel
+    '''
+    h, w = shape[:2]
+    x0, y0, x1, y1 = line_segments.T
+    columns = numpy.round(x0)
+    same_column = columns == numpy.round(x1)
+    
+    # segments inside a column draw nothing when they are mostly horizontal,
+    # or when both ends round to the same row
+    r0 = numpy.round(y0)
+    r1 = numpy.round(y1)
+    spans = (
+        same_column &
+        (numpy.abs(x1 - x0) <= numpy.abs(y1 - y0)) &
+        (r0 != r1) &
+        (columns >= 0) &
+        (columns < w)
+    )
+    first_rows = numpy.maximum(numpy.minimum(r0, r1), 0)
+    last_rows = numpy.minimum(numpy.maximum(r0, r1), h-1)
+    spans &= first_rows <= last_rows
+    span_segments = numpy.flatnonzero(spans)
+    
+    return (
+        ~same_column,
+        span_segments,
+        columns[span_segments].astype(int),
+        first_rows[span_segments].astype(int),
+        last_rows[span_segments].astype(int),
+    )
+
 def rasterize_poly_line(int_image, poly_line, color):
     '''
     draws a poly_line consisting of a series of (x,y) locations
@@ -171,15 +331,9 @@ def rasterize_poly_line(int_image, poly_line, color):
     poly_line : the coordinates of the line in [(x0, y0), (x1, y1)...] format
     color     : an integer to draw at each location the poly_line touches
     '''
-    for i in range(poly_line.shape[0]-1):
-        p0 = poly_line[i]
-        p1 = poly_line[i+1]
-        if p1.shape[0] == 2 or p1[2]:
-            rasterize_line_segment(
-                int_image,
-                (p0[0], p0[1], p1[0], p1[1]),
-                color,
-            )
+    ys, xs, _ = line_segment_pixels(
+        poly_line_segments(poly_line), int_image.shape)
+    int_image[ys, xs] = color_name_to_index[color]
 
 # legend =======================================================================
 def make_legend(names, colors, width, color_palette=None):
@@ -188,45 +342,30 @@ def make_legend(names, colors, width, color_palette=None):
     
     colors : a dictionary mapping names to colors
     '''
+    from colorama import Fore
+    
     legend = '\n'.join([
         getattr(Fore, colors[name]) + name.ljust(width)[:width] +
-        Style.RESET_ALL
+        reset_all
         #for name, color in colors.items()
         for name in names
         if colors[name] != 'EMPTY'
     ])
-    return legend + Style.RESET_ALL
+    return legend + reset_all
 
 # high level plotting ==========================================================
-def plot_poly_lines(
-    poly_lines,
-    width=80,
-    height=20,
+def image_size(
+    width,
+    height,
     border=None,
     title=None,
-    x_range=None,
-    y_range=None,
-    colors=None,
-    legend=False,
+    legend_rows=0,
     min_max_y=False,
 ):
     '''
-    plot muliple polylines 
-    
-    poly_lines : a dictionary of {name:poly_line} pairs
-    width      : width of the text_image
-    height     : height of the text_image
-    title      : the title of the plot (None will omit)
-    x_range    : the min/max x coordinates of the image
-    y_range    : the min/max y coordinates of the image
-    colors     : a dictionary of colors to assign to each poly_line
-                 'auto' will automatically asign colors,
-                 None will assign no colors
-    legend     : if True, will add a legend
-    min_max_y   : if True, will show the minimum and maximum value of y
+    returns the (width, height) in characters that is left for the image of a
+    plot after making room for the border, title, legend and min/max lines
     '''
-    
-    # adjust height/width to account for other elements
     if border == 'line':
         width -= 2
         height -= 2
@@ -235,8 +374,7 @@ def plot_poly_lines(
     elif border == 'top_line' or border == 'bottom_line':
         height -= 1
     
-    if legend:
-        height -= len(poly_lines)
+    height -= legend_rows
     
     if title:
         height -= 1
@@ -244,6 +382,136 @@ def plot_poly_lines(
     if min_max_y:
         height -= 2
     
+    return width, height
+
+def poly_line_axes(poly_lines, x_range=None, y_range=None):
+    '''
+    computes the x and y range of the image that will display poly_lines,
+    along with the minimum and maximum y value of the data
+    
+    poly_lines : a dictionary of non-empty poly_lines
+    x_range    : a fixed x range, or None to fit the data
+    y_range    : a fixed y range, or None to fit the data
+    '''
+    if x_range is None:
+        x_min = min(numpy.min(line[:,0]) for line in poly_lines.values())
+        x_max = max(numpy.max(line[:,0]) for line in poly_lines.values())
+        x_range = (x_min, x_max)
+        if x_range[1] - x_range[0] == 0:
+            x_range = (x_range[0]-1, x_range[1]+1)
+    
+    y_min = min(numpy.min(line[:,1]) for line in poly_lines.values())
+    y_max = max(numpy.max(line[:,1]) for line in poly_lines.values())
+    if y_range is None:
+        y_range = (y_min, y_max)
+        if y_range[1] - y_range[0] == 0:
+            y_range = (y_range[0]-1, y_range[1]+1)
+    
+    return x_range, y_range, y_min, y_max
+
+def draw_poly_lines(order_image, poly_lines, x_range, y_range, series=None):
+    '''
+    draws poly_lines onto an order_image, an int_image where each pixel holds
+    one plus the index of the last poly_line that touched it
+    
+    order_image : the image to draw onto, pixels only ever increase
+    poly_lines  : a list of poly_lines
+    x_range     : the x range of the image
+    y_range     : the y range of the image
+    series      : the index of each poly_line (defaults to its position)
+    '''
+    x_scale = (x_range[1] - x_range[0])
+    y_scale = (y_range[1] - y_range[0])
+    if not (x_scale and y_scale) or not len(poly_lines):
+        return order_image
+    
+    if series is None:
+        series = range(len(poly_lines))
+    h, w = order_image.shape
+    
+    # normalize every poly_line at once
+    points = numpy.concatenate(
+        [numpy.asarray(line)[:,:2] for line in poly_lines])
+    points = points - (x_range[0], y_range[0])
+    points /= (x_scale, y_scale)
+    points[:,1] = 1. - points[:,1]
+    points *= (w-1, h-1)
+    
+    lengths = [len(line) for line in poly_lines]
+    point_series = numpy.repeat(numpy.array(series, dtype=int), lengths)
+    line_index = numpy.repeat(numpy.arange(len(lengths)), lengths)
+    pen = numpy.concatenate([
+        numpy.asarray(line)[:,2] != 0 if numpy.shape(line)[1] > 2
+        else numpy.ones(len(line), dtype=bool)
+        for line in poly_lines
+    ])
+    
+    # a segment is drawn if both ends belong to the same poly_line
+    # and the pen is not lifted at its end point
+    draw = (line_index[1:] == line_index[:-1]) & pen[1:]
+    segments = numpy.concatenate((points[:-1], points[1:]), axis=1)[draw]
+    segment_series = point_series[:-1][draw]
+    
+    # later poly_lines are drawn over earlier ones, so draw the index of each
+    # poly_line and keep the largest at every pixel
+    rasterize, span_segments, span_columns, first_rows, last_rows = (
+        column_spans(segments, order_image.shape))
+    ys, xs, segment = line_segment_pixels(
+        segments[rasterize], order_image.shape)
+    numpy.maximum.at(
+        order_image, (ys, xs), segment_series[rasterize][segment] + 1)
+    
+    # fill in the spans by accumulating +1 at the first row and -1 after the
+    # last row of each span, separately for each poly_line
+    num_series = numpy.max(point_series) + 1
+    span_series = segment_series[span_segments]
+    starts = (span_series*(h+1) + first_rows)*w + span_columns
+    ends = (span_series*(h+1) + last_rows + 1)*w + span_columns
+    size = num_series*(h+1)*w
+    coverage = (
+        numpy.bincount(starts, minlength=size) -
+        numpy.bincount(ends, minlength=size)
+    ).reshape(num_series, h+1, w).cumsum(axis=1)[:,:h]
+    numpy.maximum(order_image, (
+        (coverage > 0) * numpy.arange(1, num_series+1)[:,None,None]
+    ).max(axis=0), out=order_image)
+    
+    return order_image
+
+def order_image_to_int_image(order_image, drawn_names, colors=None):
+    '''
+    replaces the poly_line indices in an order_image with their colors
+    
+    drawn_names : the names of the poly_lines drawn on the order_image, in
+                  the same order as their indices
+    '''
+    if colors is None:
+        color_indices = [1] * len(drawn_names)
+    else:
+        color_indices = [
+            color_name_to_index[colors[name]] for name in drawn_names]
+    return numpy.array([0] + color_indices)[order_image]
+
+def compose_plot(
+    image,
+    names,
+    width,
+    border=None,
+    title=None,
+    colors=None,
+    legend=False,
+    min_max_y=False,
+    y_min=None,
+    y_max=None,
+):
+    '''
+    assembles the text of a plot around a text_image
+    
+    image       : the text_image of the plot, or None if nothing was drawn
+    names       : the names of every poly_line, used by the legend
+    width       : the width in characters of the image
+    y_min/y_max : the values shown by min_max_y
+    '''
     content = []
     if border == 'top_line' or border == 'top_bottom_line':
         content.append(hh*(width))
@@ -251,70 +519,19 @@ def plot_poly_lines(
         t = ('%s:'%title).ljust(width)[:width]
         content.append(t)
     if legend and (colors is not None):
-        content.append(make_legend(poly_lines.keys(), colors, width))
-    
-    poly_lines = {k:v for k,v in poly_lines.items() if len(v)}
+        content.append(make_legend(names, colors, width))
     
-    if len(poly_lines):
-        x_min = min(numpy.min(line[:,0]) for line in poly_lines.values())
-        x_max = max(numpy.max(line[:,0]) for line in poly_lines.values())
-        if x_range is None:
-            x_range = (x_min, x_max)
-            x_scale = (x_range[1] - x_range[0])
-            if x_scale == 0:
-                x_range = (x_range[0]-1, x_range[1]+1)
-                x_scale = 2
-            
-        else:
-            x_scale = (x_range[1] - x_range[0])
-        
-        y_min = min(numpy.min(line[:,1]) for line in poly_lines.values())
-        y_max = max(numpy.max(line[:,1]) for line in poly_lines.values())
-        if y_range is None:
-            y_range = (y_min, y_max)
-            y_scale = (y_range[1] - y_range[0])
-            if y_scale == 0:
-                y_range = (y_range[0]-1, y_range[1]+1)
-                y_scale = 2
-        
-        else:
-            y_scale = (y_range[1] - y_range[0])
-        
+    if image is not None:
         if min_max_y:
             max_line = (
-                Style.RESET_ALL + ('Max: %.06f'%y_max).ljust(width))
+                reset_all + ('Max: %.06f'%y_max).ljust(width))
             content.append(max_line)
         
-        image = numpy.zeros((height*4, width*2), dtype=int)
-        
-        if x_scale and y_scale:
-            for name, poly_line in poly_lines.items():
-                if colors is None:
-                    color = 1
-                else:
-                    color = colors[name]
-                
-                poly_line = numpy.array(poly_line).copy()
-                poly_line[:,0] -= x_range[0]
-                poly_line[:,0] /= x_scale
-                poly_line[:,0] *= width*2-1
-                
-                poly_line[:,1] -= y_range[0]
-                poly_line[:,1] /= y_scale
-                poly_line[:,1] = 1. - poly_line[:,1]
-                poly_line[:,1] *= height*4-1
-                
-                rasterize_poly_line(image, poly_line, color)
-        
-        image = int_image_to_text_image(
-            image,
-            use_colors=(colors is not None),
-        )
         content.append(image)
         
         if min_max_y:
             min_line = (
-                Style.RESET_ALL + ('Min: %.06f'%y_min).ljust(width))
+                reset_all + ('Min: %.06f'%y_min).ljust(width))
             content.append(min_line)
     
     if border == 'bottom_line' or border == 'top_bottom_line':
@@ -323,9 +540,76 @@ def plot_poly_lines(
     content = '\n'.join(content)
     if border == 'line':
         content = grid([[content]], width, border='line')
-
+    
     return content
 
+def plot_poly_lines(
+    poly_lines,
+    width=80,
+    height=20,
+    border=None,
+    title=None,
+    x_range=None,
+    y_range=None,
+    colors=None,
+    legend=False,
+    min_max_y=False,
+):
+    '''
+    plot muliple polylines 
+    
+    poly_lines : a dictionary of {name:poly_line} pairs
+    width      : width of the text_image
+    height     : height of the text_image
+    title      : the title of the plot (None will omit)
+    x_range    : the min/max x coordinates of the image
+    y_range    : the min/max y coordinates of the image
+    colors     : a dictionary of colors to assign to each poly_line
+                 'auto' will automatically asign colors,
+                 None will assign no colors
+    legend     : if True, will add a legend
+    min_max_y   : if True, will show the minimum and maximum value of y
+    '''
+    
+    # adjust height/width to account for other elements
+    width, height = image_size(
+        width,
+        height,
+        border=border,
+        title=title,
+        legend_rows=len(poly_lines) if legend else 0,
+        min_max_y=min_max_y,
+    )
+    
+    names = list(poly_lines.keys())
+    poly_lines = {k:v for k,v in poly_lines.items() if len(v)}
+    
+    image = None
+    y_min = y_max = None
+    if len(poly_lines):
+        x_range, y_range, y_min, y_max = poly_line_axes(
+            poly_lines, x_range, y_range)
+        order_image = numpy.zeros((height*4, width*2), dtype=int)
+        draw_poly_lines(
+            order_image, list(poly_lines.values()), x_range, y_range)
+        image = int_image_to_text_image(
+            order_image_to_int_image(order_image, poly_lines.keys(), colors),
+            use_colors=(colors is not None),
+        )
+    
+    return compose_plot(
+        image,
+        names,
+        width,
+        border=border,
+        title=title,
+        colors=colors,
+        legend=legend,
+        min_max_y=min_max_y,
+        y_min=y_min,
+        y_max=y_max,
+    )
+
 def grid(text_images, cell_width, border=None):
     '''
     combines a list of text_images into a single grid text image
@@ -377,6 +661,8 @@ def grid(text_images, cell_width, border=None):
     return content
 
 def compute_windowed_mean_std(line, window):
+    from scipy.ndimage import uniform_filter1d
+    
     x = line[:,0]
     y = line[:,1]
     
@@ -384,28 +670,63 @@ def compute_windowed_mean_std(line, window):
     y_var = uniform_filter1d((y - y_mean)**2, size=window, mode='nearest')
     y_std = y_var**0.5
     
-    length = line.shape[0]
-    mean_std_line = numpy.ones((length*3, 3))
-    mean_std_line[:length,0] = x
-    mean_std_line[:length,1] = y_mean
-    mean_std_line[length:length*2,0] = x
-    mean_std_line[length:length*2,1] = y_mean + y_std
-    mean_std_line[length*2:length*3,0] = x
-    mean_std_line[length*2:length*3,1] = y_mean - y_std
-    mean_std_line[length,2] = 0
-    mean_std_line[length*2,2] = 0
+    return envelope_poly_line(x, y_mean, y_mean - y_std, y_mean + y_std)
+
+def envelope_poly_line(x, center, lower, upper):
+    '''
+    builds a single poly_line that draws a center line together with an upper
+    and lower envelope around it, using the third column to lift the pen
+    between the three pieces
+    
+    x      : the x coordinates shared by all three pieces
+    center : the y coordinates of the center line
+    lower  : the y coordinates of the lower envelope
+    upper  : the y coordinates of the upper envelope
+    '''
+    length = x.shape[0]
+    envelope_line = numpy.ones((length*3, 3))
+    envelope_line[:length,0] = x
+    envelope_line[:length,1] = center
+    envelope_line[length:length*2,0] = x
+    envelope_line[length:length*2,1] = upper
+    envelope_line[length*2:length*3,0] = x
+    envelope_line[length*2:length*3,1] = lower
+    if length:
+        envelope_line[length,2] = 0
+        envelope_line[length*2,2] = 0
     
-    return mean_std_line
+    return envelope_line
 
-def plot_logs(
+def logs_to_poly_lines(
     logs,
     x_coord='step',
     x_range=(0.,1.),
     windowed_mean_std=False,
-    **kwargs,
+    envelope=None,
+    resolution=None,
+    smoothing=None,
 ):
+    '''
+    converts a dictionary of {name:log} pairs to {name:poly_line} pairs,
+    see plot_logs
+    '''
+    if smoothing:
+        return {
+            name:log.to_smoothed_poly_line(
+                x_coord, x_range=x_range, smoothing=smoothing)
+            for name, log in logs.items()
+        }
+    
+    if envelope:
+        return {
+            name:log.to_envelope_poly_line(
+                x_coord, x_range=x_range, envelope=envelope)
+            for name, log in logs.items()
+        }
+    
     poly_lines = {
-        name:log.to_poly_line(x_coord, x_range=x_range)
+        name:log.to_poly_line(
+            x_coord, x_range=x_range, resolution=resolution)
         for name, log in logs.items()
     }
     
@@ -415,8 +736,192 @@ def plot_logs(
             for name, line in poly_lines.items()
         }
     
+    return poly_lines
+
+def plot_logs(
+    logs,
+    x_coord='step',
+    x_range=(0.,1.),
+    windowed_mean_std=False,
+    envelope=None,
+    smoothing=None,
+    **kwargs,
+):
+    '''
+    plots a dictionary of {name:log} pairs
+    
+    windowed_mean_std : if nonzero, draws the mean +/- std computed over a
+                        sliding window of this many rows
+    envelope          : 'min_max' or 'std' to draw an envelope around each log
+                        from the statistics stored in each row (the logs must
+                        be created with statistics=True)
+    smoothing         : 'window' to draw the rolling mean +/- std or 'ema' to
+                        draw the exponential moving average that each log
+                        maintained as values arrived (the logs must be created
+                        with smoothing_window or smoothing_half_life)
+    '''
+    poly_lines = logs_to_poly_lines(
+        logs,
+        x_coord,
+        x_range,
+        windowed_mean_std=windowed_mean_std,
+        envelope=envelope,
+        resolution=kwargs.get('width', 80) * 2,
+        smoothing=smoothing,
+    )
     return plot_poly_lines(poly_lines, **kwargs)
 
+class RenderCache:
+    '''
+    Remembers the image drawn by the last call to plot_logs, so that calling
+    plot_logs again on the same logs only draws the rows that were completed
+    since then, plus the row that is still being averaged.
+    
+    The image is only reused when the plot arguments, the axes of the image
+    and the compression of every log are unchanged, otherwise it is redrawn
+    from scratch.  Axes that fit the data change whenever the data grows past
+    them, so the cache is most effective with fixed axes: x_axis for the x
+    coordinates and y_range for the y coordinates.  Windowed, envelope and
+    smoothed plots are always redrawn from scratch.
+    '''
+    def __init__(self):
+        self.key = None
+        self.order_image = None
+        self.drawn = {}
+    
+    def plot_logs(
+        self,
+        logs,
+        x_coord='step',
+        x_range=(0.,1.),
+        x_axis=None,
+        windowed_mean_std=False,
+        envelope=None,
+        smoothing=None,
+        width=80,
+        height=20,
+        border=None,
+        title=None,
+        y_range=None,
+        colors=None,
+        legend=False,
+        min_max_y=False,
+    ):
+        '''
+        the same as plot_logs, with an optional fixed x_axis for the image
+        
+        x_axis : the min/max x coordinates of the image, None fits the data
+        '''
+        poly_lines = logs_to_poly_lines(
+            logs,
+            x_coord,
+            x_range,
+            windowed_mean_std=windowed_mean_std,
+            envelope=envelope,
+            resolution=width*2,
+            smoothing=smoothing,
+        )
+        width, height = image_size(
+            width,
+            height,
+            border=border,
+            title=title,
+            legend_rows=len(poly_lines) if legend else 0,
+            min_max_y=min_max_y,
+        )
+        names = list(poly_lines.keys())
+        poly_lines = {k:v for k,v in poly_lines.items() if len(v)}
+        drawn_names = list(poly_lines.keys())
+        
+        if not len(poly_lines):
+            self.key = None
+            return compose_plot(
+                None, names, width,
+                border=border, title=title, colors=colors, legend=legend)
+        
+        x_axis, y_axis, y_min, y_max = poly_line_axes(
+            poly_lines, x_axis, y_range)
+        key = (
+            x_coord,
+            tuple(x_range),
+            windowed_mean_std,
+            envelope,
+            smoothing,
+            width,
+            height,
+            tuple(drawn_names),
+            tuple(x_axis),
+            tuple(y_axis),
+        )
+        
+        incremental = (
+            key == self.key and
+            not windowed_mean_std and
+            not envelope and
+            not smoothing and
+            tuple(x_range) == (0., 1.) and
+            all(self._can_extend(name, logs[name], poly_lines[name])
+                for name in drawn_names)
+        )
+        if not incremental:
+            self.key = key
+            self.order_image = numpy.zeros((height*4, width*2), dtype=int)
+            self.drawn = {}
+        
+        # draw the rows that were completed since the last call onto the
+        # cached image, and the rows that may still change onto a copy
+        new_lines = []
+        tail_lines = []
+        for name, line in poly_lines.items():
+            log = logs[name]
+            drawn_rows = self.drawn.get(name, (None, None, 0, None))[2]
+            if hasattr(log, 'step') and hasattr(log, 'compression'):
+                complete_rows = min(log.step // log.compression, len(line))
+            else:
+                complete_rows = 0
+            new_lines.append(line[max(drawn_rows-1, 0):complete_rows])
+            tail_lines.append(line[max(complete_rows-1, 0):])
+            if complete_rows:
+                self.drawn[name] = (
+                    log,
+                    log.compression,
+                    complete_rows,
+                    numpy.array(line[complete_rows-1]),
+                )
+        
+        series = range(len(drawn_names))
+        draw_poly_lines(self.order_image, new_lines, x_axis, y_axis, series)
+        order_image = self.order_image.copy()
+        draw_poly_lines(order_image, tail_lines, x_axis, y_axis, series)
+        
+        image = int_image_to_text_image(
+            order_image_to_int_image(order_image, drawn_names, colors),
+            use_colors=(colors is not None),
+        )
+        return compose_plot(
+            image,
+            names,
+            width,
+            border=border,
+            title=title,
+            colors=colors,
+            legend=legend,
+            min_max_y=min_max_y,
+            y_min=y_min,
+            y_max=y_max,
+        )
+    
+    def _can_extend(self, name, log, line):
+        if name not in self.drawn:
+            return True
+        drawn_log, compression, rows, last_point = self.drawn[name]
+        return (
+            drawn_log is log and
+            log.compression == compression and
+            len(line) >= rows and
+            numpy.array_equal(line[rows-1], last_point)
+        )
+
 def plot_logs_grid(
     log_grid,
     x_coord='step',
@@ -425,26 +930,116 @@ def plot_logs_grid(
     colors=None,
     border=None,
     *args,
+    jobs=1,
     **kwargs
 ):
+    '''
+    plots a grid of plots, where each cell of log_grid is a dictionary of
+    {name:log} pairs that is plotted like plot_logs
+    
+    Every cell is drawn into its own region of one shared int_image, which is
+    then converted to braille in a single pass.
+    
+    jobs : the number of threads used to draw the cells
+    '''
     grid_width = max(len(row) for row in log_grid)
-    cell_width=width//grid_width - 2
+    cell_width = width//grid_width - 2
+    cell_height = height//len(log_grid)
+    
+    # positional arguments continue the arguments of plot_logs
+    log_args = args if args else (x_coord,)
+    log_kwargs = {
+        key : kwargs.pop(key)
+        for key in ('x_range', 'windowed_mean_std', 'envelope', 'smoothing')
+        if key in kwargs
+    }
+    y_range = kwargs.pop('y_range', None)
+    legend = kwargs.get('legend', False)
+    
+    # lay out the image of every cell on the shared int_image, one row of
+    # cells below the other
+    cells = []
+    canvas_height = 0
+    canvas_width = 0
+    for row in log_grid:
+        column = 0
+        row_height = 0
+        for logs in row:
+            w, h = image_size(
+                cell_width,
+                cell_height,
+                title=kwargs.get('title', None),
+                legend_rows=len(logs) if legend else 0,
+                min_max_y=kwargs.get('min_max_y', False),
+            )
+            cells.append((logs, w, canvas_height, column, h*4, w*2))
+            column += w*2
+            row_height = max(row_height, h*4)
+        canvas_height += row_height
+        canvas_width = max(canvas_width, column)
+    
+    int_image = numpy.zeros((canvas_height, canvas_width), dtype=int)
+    
+    def draw_cell(cell):
+        logs, w, y, x, image_height, image_width = cell
+        poly_lines = logs_to_poly_lines(
+            logs, *log_args, resolution=cell_width*2, **log_kwargs)
+        names = list(poly_lines.keys())
+        poly_lines = {k:v for k,v in poly_lines.items() if len(v)}
+        if not len(poly_lines):
+            return names, None, None, None
+        
+        x_axis, y_axis, y_min, y_max = poly_line_axes(
+            poly_lines, None, y_range)
+        order_image = numpy.zeros((image_height, image_width), dtype=int)
+        draw_poly_lines(
+            order_image, list(poly_lines.values()), x_axis, y_axis)
+        int_image[y:y+image_height, x:x+image_width] = (
+            order_image_to_int_image(order_image, poly_lines.keys(), colors))
+        return names, y_min, y_max, True
+    
+    if jobs > 1:
+        from concurrent.futures import ThreadPoolExecutor
+        with ThreadPoolExecutor(jobs) as pool:
+            drawn_cells = list(pool.map(draw_cell, cells))
+    else:
+        drawn_cells = [draw_cell(cell) for cell in cells]
+    
+    chars, char_colors = int_image_to_braille(int_image)
+    cell_columns = [x//2 for _, _, _, x, _, _ in cells]
+    text_cells = braille_to_text_cells(
+        chars,
+        char_colors if colors is not None else None,
+        breaks=cell_columns,
+    )
+    reset = reset_all if colors is not None else ''
+    
     plots = []
-
-    n = 0
-    for i, row in enumerate(log_grid):
+    cell_index = 0
+    for row in log_grid:
         plots.append([])
-        for j, logs in enumerate(row):
-            plots[-1].append(plot_logs(
-                logs,
-                width=cell_width,
-                height=height//len(log_grid),
+        for logs in row:
+            _, w, y, x, image_height, image_width = cells[cell_index]
+            names, y_min, y_max, drawn = drawn_cells[cell_index]
+            cell_index += 1
+            image = None
+            if drawn:
+                rows = slice(y//4, (y+image_height)//4)
+                columns = slice(x//2, (x+image_width)//2)
+                image = '\n'.join(
+                    ''.join(line) + reset
+                    for line in text_cells[rows, columns].tolist()
+                )
+            plots[-1].append(compose_plot(
+                image,
+                names,
+                w,
                 colors=colors,
-                *args,
+                y_min=y_min,
+                y_max=y_max,
                 **kwargs,
             ))
-            n += len(logs)
-
+    
     return grid(plots, cell_width, border=border)
 
 def plot_histogram(
@@ -464,7 +1059,7 @@ def plot_histogram(
     
     int_image = numpy.zeros((len(histogram)*4, clipped_width*2))
     if max_histogram is None:
-        max_histogram = max(histogram.values())
+        max_histogram = max(histogram.values()) or 1
         histogram = {k:v/max_histogram for k,v in histogram.items()}
 
     for i, (k, v) in enumerate(histogram.items()):
@@ -482,9 +1077,10 @@ def plot_histogram(
             a + b for a,b in zip(labels.splitlines(), text_image.splitlines()))
     
     if colors is not None:
+        from colorama import Fore
         lines = text_image.splitlines()
         for i,k in enumerate(histogram.keys()):
-            lines[i] = getattr(Fore, colors[k]) + lines[i] + Style.RESET_ALL
+            lines[i] = getattr(Fore, colors[k]) + lines[i] + reset_all
         text_image = '\n'.join(lines)
     
     if show_scale:
@@ -510,3 +1106,22 @@ def numeric_histogram(data, bins, show_names=True, width=80, show_scale=False):
         show_scale=show_scale,
     )
 
+def plot_histogram_log(
+    histogram_log,
+    x_range=(0., 1.),
+    show_names=True,
+    width=80,
+    show_scale=False,
+):
+    '''
+    plots the values counted by a HistogramLog over x_range, a fraction of
+    all of the steps it has logged
+    '''
+    return plot_histogram(
+        histogram_log.to_histogram(x_range),
+        show_names=show_names,
+        width=width,
+        format_string='%.02f-%.02f:',
+        show_scale=show_scale,
+    )
+
@@ -0,0 +1,193 @@
+import os
+import time
+import threading
+
+import numpy
+
+from conspiracy.log import Log
+
+'''
+An append-only file format for following a Log from another process.  The
+writer appends a record every time a row of the log is completed (or the log
+compresses), and the reader rebuilds the Log incrementally from the last
+offset it read, so monitoring a run only costs as much as the new data.
+
+file layout:
+header  : magic (8 bytes), version (int64), capacity (int64, -1 for adaptive),
+          compression (int64) at the time the stream was started
+records : 32 bytes each, (kind, value, step, time)
+          kind >= 0  : the completed contents of row kind
+          kind == -1 : the log compressed
+'''
+
+stream_magic = b'CNSPSTRM'
+stream_version = 1
+header_dtype = numpy.dtype([
+    ('magic', 'S8'),
+    ('version', '<i8'),
+    ('capacity', '<i8'),
+    ('compression', '<i8'),
+])
+record_dtype = numpy.dtype([
+    ('kind', '<i8'),
+    ('value', '<f8'),
+    ('step', '<f8'),
+    ('time', '<f8'),
+])
+compress_kind = -1
+default_flush_interval = 1.
+
+class LogStreamWriter:
+    '''
+    Appends the completed rows of a log to a stream file.  Use Log.stream_to
+    to create one.  Rows that are already complete when the stream is
+    started are written immediately.
+    
+    flush_interval : the maximum number of seconds written records can wait
+                     in the file buffer before they become visible to readers,
+                     enforced with a background timer when no later write
+                     comes along to flush them
+    '''
+    def __init__(self, log, path, flush_interval=default_flush_interval):
+        self.log = log
+        self.path = path
+        self.flush_interval = flush_interval
+        self.lock = threading.Lock()
+        self.timer = None
+        self.file = open(path, 'wb')
+        header = numpy.zeros(1, dtype=header_dtype)
+        header['magic'] = stream_magic
+        header['version'] = stream_version
+        header['capacity'] = -1 if log.capacity == 'adaptive' else log.capacity
+        header['compression'] = log.compression
+        self.file.write(header.tobytes())
+        self.last_flush = time.time()
+        
+        # make the header (and the rows that are already complete) visible
+        # right away, so readers can open the stream before the next flush
+        self.write_rows(0, log.step // log.compression)
+        self.flush()
+    
+    def write_rows(self, start, end):
+        if end <= start:
+            return
+        records = numpy.zeros(end - start, dtype=record_dtype)
+        records['kind'] = numpy.arange(start, end)
+        rows = self.log.data[start:end]
+        records['value'] = rows[:,0]
+        records['step'] = rows[:,1]
+        records['time'] = rows[:,2]
+        self._write(records)
+    
+    def write_compress(self):
+        records = numpy.zeros(1, dtype=record_dtype)
+        records['kind'] = compress_kind
+        self._write(records)
+    
+    def _write(self, records):
+        with self.lock:
+            self.file.write(records.tobytes())
+            now = time.time()
+            if now - self.last_flush >= self.flush_interval:
+                self._flush()
+            elif self.timer is None:
+                # flush these records later even if no more rows arrive
+                self.timer = threading.Timer(
+                    self.last_flush + self.flush_interval - now,
+                    self._timed_flush,
+                )
+                self.timer.daemon = True
+                self.timer.start()
+    
+    def _timed_flush(self):
+        with self.lock:
+            self.timer = None
+            if not self.file.closed:
+                self._flush()
+    
+    def _flush(self):
+        self.file.flush()
+        self.last_flush = time.time()
+    
+    def flush(self):
+        with self.lock:
+            self._flush()
+    
+    def close(self):
+        with self.lock:
+            if self.timer is not None:
+                self.timer.cancel()
+                self.timer = None
+            self.file.close()
+        if self.log.stream is self:
+            self.log.stream = None
+
+class LogStreamReader:
+    '''
+    Rebuilds a Log from a stream file.  Every call to update reads only the
+    records appended since the previous call.  The rebuilt log contains every
+    completed row, but not the row that the writer is currently filling.
+    '''
+    def __init__(self, path):
+        self.path = path
+        self.log = None
+        self.offset = 0
+        self.update()
+    
+    def update(self):
+        '''
+        reads any new records and returns True if the log changed
+        '''
+        try:
+            size = os.path.getsize(self.path)
+        except FileNotFoundError:
+            return False
+        
+        with open(self.path, 'rb') as f:
+            if self.log is None:
+                if size < header_dtype.itemsize:
+                    return False
+                header = numpy.frombuffer(
+                    f.read(header_dtype.itemsize), dtype=header_dtype)[0]
+                if header['magic'] != stream_magic:
+                    raise ValueError('%s is not a log stream'%self.path)
+                if header['version'] != stream_version:
+                    raise ValueError(
+                        'unsupported log stream version: %i'%header['version'])
+                capacity = int(header['capacity'])
+                if capacity == -1:
+                    capacity = 'adaptive'
+                self.log = Log(capacity=capacity)
+                self.log.compression = int(header['compression'])
+                self.offset = header_dtype.itemsize
+            
+            count = (size - self.offset) // record_dtype.itemsize
+            if count <= 0:
+                return False
+            f.seek(self.offset)
+            records = numpy.frombuffer(
+                f.read(count * record_dtype.itemsize), dtype=record_dtype)
+        self.offset += count * record_dtype.itemsize
+        
+        # apply the rows between each compression as one vectorized update
+        compressions = numpy.flatnonzero(records['kind'] == compress_kind)
+        start = 0
+        for end in compressions.tolist() + [records.shape[0]]:
+            self._apply_rows(records[start:end])
+            if end < records.shape[0]:
+                self.log.compress()
+            start = end + 1
+        
+        return True
+    
+    def _apply_rows(self, records):
+        if not records.shape[0]:
+            return
+        rows = records['kind']
+        end = int(rows.max()) + 1
+        if end > self.log.data.shape[0]:
+            self.log.grow(end)
+        self.log.data[rows,0] = records['value']
+        self.log.data[rows,1] = records['step']
+        self.log.data[rows,2] = records['time']
+        self.log.step = max(self.log.step, end * self.log.compression)